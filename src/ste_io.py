@@ -13,32 +13,110 @@ used by DLR-HR institute and some others.
 from __future__ import absolute_import
 from __future__ import print_function
 import ctypes
+import struct
 import os
 import copy
+import importlib
+import contextlib
+import time
+import itertools
+import json
+import pickle
+import threading
+import fnmatch
+import zlib
+import base64
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from scipy import misc
 import numpy as np
 import mmap
 
 import warnings
 
-try:
-    import h5py
-except ImportError:
-    warnings.warn('Failed to import "h5py". The HDFarray class will not work.', ImportWarning)
-
-try:
-    import lxml.etree as ET
-except ImportError:
-    warnings.warn('Failed to import ET from "lxml.etree". The Py2XML class will not work.', ImportWarning)
+# optional backends, imported on first use by _lazy_import (or as attributes of the module):
+# name -> (module, attribute, what doesn't work without it)
+_lazy_imports = {
+    'h5py': ('h5py', None, 'The HDFarray class will not work.'),
+    'ET': ('lxml.etree', None, 'The Py2XML class will not work.'),
+    'misc': ('scipy.misc', None, 'write_pixmap will not work.'),
+    'resource_string': ('pkg_resources', 'resource_string',
+                        'Writing geo-Envi-headers for RAT files will not work.'),
+    'Template': ('mako.template', 'Template',
+                 'Writing geo-Envi-headers for RAT files will not work.'),
+    'multiprocessing': ('multiprocessing', None, 'HDFarray.read_parallel will not work.'),
+    'ProcessPoolExecutor': ('concurrent.futures', 'ProcessPoolExecutor',
+                            'HDFarray.read_parallel will not work.'),
+    'shared_memory': ('multiprocessing.shared_memory', None,
+                      'HDFarray.read_parallel will read serially.'),
+    # optional compressors for RAT-Z files, zlib is used otherwise
+    'zstandard': ('zstandard', None, 'RAT-Z files will be compressed with zlib.'),
+    'lz4_frame': ('lz4.frame', None, 'RAT-Z files will be compressed with zlib.'),
+}
+_lazy_failed = set()
+
+
+def _lazy_import(name):
+    """Import an optional backend of _lazy_imports; names used inside this module must be got
+    with this function, they are not module globals until imported."""
+    obj = globals().get(name)
+    if obj is None:
+        module, attr, msg = _lazy_imports[name]
+        try:
+            if name in _lazy_failed:
+                raise ImportError(module)
+            obj = importlib.import_module(module)
+            if attr is not None:
+                obj = getattr(obj, attr)
+        except ImportError:
+            _lazy_failed.add(name)
+            raise ImportError('Failed to import "%s". %s' % (module, msg))
+        globals()[name] = obj
+    return obj
+
+
+def _optional_import(name):
+    """Like _lazy_import, but returns None if the backend is not available."""
+    try:
+        return _lazy_import(name)
+    except ImportError:
+        return None
+
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        return _lazy_import(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 try:
-    from pkg_resources import resource_string
-    from mako.template import Template
+    import fcntl
 except ImportError:
-    warnings.warn('Failed ot import pkg_resources and/or mako. Writing geo-Envi-headers for RAT files will not work.',
+    fcntl = None
+    warnings.warn('Failed to import "fcntl". RatTileWriter will not lock overlapping blocks.',
                   ImportWarning)
 
+# serializes the emulated positioned reads and writes where os.pread and
+# os.pwrite are missing (e.g. Windows)
+_seek_lock = threading.Lock()
+
+
+def _pread(fd, n, offset):
+    """Read up to n bytes at an offset of a file descriptor, like os.pread."""
+    if hasattr(os, 'pread'):
+        return os.pread(fd, n, offset)
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, n)
+
+
+def _pwrite(fd, data, offset):
+    """Write data at an offset of a file descriptor, like os.pwrite."""
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fd, data, offset)
+    with _seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.write(fd, data)
+
 red = "\033[91m"
 endc = "\033[0m"
 
@@ -60,9 +138,9 @@ try:
         """
         if palette is True and myPalette is not False:
             p = myPalette
-            misc.imsave(filename, p[image_array])
+            _lazy_import('misc').imsave(filename, p[image_array])
         else:
-            misc.imsave(filename, image_array)
+            _lazy_import('misc').imsave(filename, image_array)
     write_png = write_pixmap
     write_jpg = write_pixmap
 except ImportError:
@@ -71,82 +149,108 @@ except ImportError:
 
 def rarr(filename, **kwargs):
     """
-    Reads STE-HDF5 file, returns it as a np ndarray variable
+    Reads STE-HDF5 file, returns it as a np ndarray variable. Use datasets=['D2', ...] to read
+    only some of the datasets and block=[...] to read only a block of them.
     """
-    hdfobj = HDFarray(filename)
-    array = hdfobj.read(**kwargs)
-    if "annotation" in hdfobj.file.attrs:
-        if hdfobj.file.attrs["annotation"] != "":
-            print("Content :", hdfobj.file.attrs["annotation"])
+    with HDFarray(filename) as hdfobj:
+        array = hdfobj.read(**kwargs)
+        if "annotation" in hdfobj.file.attrs:
+            if hdfobj.file.attrs["annotation"] != "":
+                print("Content :", hdfobj.file.attrs["annotation"])
     return array
 
 
 def rarr_info(filename):
-    hdfobj = HDFarray(filename)
-    return hdfobj.info
+    with HDFarray(filename) as hdfobj:
+        return hdfobj.info
 
 
-def sarr(filename, array, info=""):
+def sarr(filename, array, info="", **kwargs):
     """
-    Writes a numpy ndarray into a STE-HDF5 file.
+    Writes a numpy ndarray into a STE-HDF5 file. The keywords chunks, compression and shuffle
+    or block are passed to HDFarray.write.
     """
-    hdfobj = HDFarray(filename)
-    hdfobj.write(array)
-    hdfobj.annotate(info)
+    with HDFarray(filename) as hdfobj:
+        hdfobj.write(array, **kwargs)
+        if info != "" or 'block' not in kwargs:
+            hdfobj.annotate(info)
 
 
-def aarr(filename, array):
+def aarr(filename, array, **kwargs):
     """
-    Adds a numpy ndarray to an existing STE-HDF5 file.
+    Adds a numpy ndarray to an existing STE-HDF5 file (keywords as for sarr).
     """
-    hdfobj = HDFarray(filename)
-    hdfobj.add(array)
+    with HDFarray(filename) as hdfobj:
+        hdfobj.add(array, **kwargs)
 
 
 class HDFarray(object):
     """
     Class to read/write single numpy arrays to HDF5  files in simple manner. Should work mostly like rrat/srat
     when using the helper routines rarr / sarr.
+
+    The file is created if it doesn't exist. The h5py file is opened read-only when it is first
+    used and reopened for writing by write / add / annotate / expose; instances of the same file
+    share the open file (see handle_pool_size), so it is reopened for all of them. close() (or
+    deleting the instance) releases it; the file is closed, i.e. flushed and unlocked for other
+    processes, when no instance uses it any more.
     """
-    file = None
 
     def __init__(self, filename):
         if not filename.endswith(".hd5"):
             filename += ".hd5"
         self.filename = filename
-        self.file = h5py.File(self.filename, 'a')
-        if "annotation" in self.file.attrs:
-            self.info = self.file.attrs["annotation"]
-        else:
-            self.info = None
+        self._entry = None
+        # the file is created if it doesn't exist; the handle is not kept
+        mode = 'r' if os.path.exists(self.filename) else 'a'
+        with _pooled_handle('h5', self.filename, mode) as lun:
+            self.info = lun.attrs["annotation"] if "annotation" in lun.attrs else None
 
-    def read(self, annotation=[], **kwargs):
-        if 'block' in kwargs:
-            print("ERROR: block write not yet implemented")
-
-        # if 'block' in kwargs:
-        #     block = kwargs['block']
-        #     self.data = self.file['data']
-        #     shp = self.data.shape
-        #     if len(shp) == 1:    # 1D data -> use only 1st block parameter
-        #         return self.data[block[0]:block[0]+block[2]]
-        #     elif len(shp) == 2:  # 2D data -> easy
-        #         return self.data[block[0]:block[0]+block[2], block[1]:block[1]+block[3]]
-        #     else:                # >2D data -> check for pixel or band interleave
-        #         p1 = reduce(mul, shp[-2:], 1)
-        #         p2 = reduce(mul, shp[:-2], 1)
-        #         p3 = reduce(mul, shp[0:2], 1)
-        #         p4 = reduce(mul, shp[2:], 1)
-        #         foo = [p1, p2, p3, p4]
-        #         idx = foo.index(min(foo))
-        #         if idx == 0 or idx == 3:  # pixel interleave
-        #             return self.data[block[0]:block[0]+block[2], block[1]:block[1]+block[3], ...]
-        #         else:                     # band interleave
-        #             return self.data[..., block[0]:block[0]+block[2], block[1]:block[1]+block[3]]
-        # else:
+    @property
+    def file(self):
+        if self._entry is None:
+            self._entry = _handle_pool_acquire('h5', self.filename, 'r')
+        return self._entry.handle
+
+    def _writable(self):
+        if self._entry is not None and self._entry.mode == 'r':
+            self.close()
+        if self._entry is None:
+            self._entry = _handle_pool_acquire('h5', self.filename, 'a')
+        return self._entry.handle
+
+    def close(self):
+        entry, self._entry = getattr(self, '_entry', None), None
+        if entry is not None:
+            _handle_pool_release(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def read(self, annotation=[], datasets=None, **kwargs):
+        """
+        Reads all datasets or only the ones given by datasets (a name or a list of names). With the
+        block keyword only a block of each dataset is read (as hyperslab selection). The block has
+        the same form as for RatFile.read, i.e. [start_1, stop_1, ..., start_N, stop_N] or, for >2D
+        arrays, only the 4 values of the two largest axes.
+        """
+        if datasets is None:
+            datasets = list(self.file)
+        elif isinstance(datasets, str):
+            datasets = [datasets]
         data = []
-        for ds in self.file:
-            data.append(self.file[ds][...])
+        for ds in datasets:
+            dataset = self.file[ds]
+            if 'block' in kwargs:
+                data.append(dataset[_block_index(kwargs['block'], dataset.shape)])
+            else:
+                data.append(dataset[...])
         if len(data) == 1:
             return data[0]
         elif len(data) == 0:
@@ -154,40 +258,285 @@ class HDFarray(object):
         else:
             return data
 
-    def write(self, array, **kwargs):
+    def read_parallel(self, block_grid=None, workers=4, dataset='D1'):
+        """
+        Reads a dataset with a pool of worker processes, each one opening the file read-only (in
+        SWMR mode where supported) and reading its blocks into a shared memory array. Unlike
+        threads, the processes are not serialised by the GIL held in h5py. Starting the processes takes
+        a moment, so this pays off for large (compressed) datasets.
+
+        block_grid is either the shape of the tiles the dataset is split into (an int or 2 values
+        for the two largest axes, or one value per axis; default: the chunks of the dataset) or a
+        list of blocks (RatFile conventions). Parts not covered by the blocks are returned as 0.
+        The blocks are passed through one shared memory slot per worker and copied into the
+        result, so besides the result only workers * (block size) bytes are needed.
+        """
+        if isinstance(dataset, str):
+            name = dataset
+        else:
+            name = "D"+str(int(dataset)+1)
+        if name not in self.file:
+            RatFile._ioerror('Dataset "%s" not found in %s' % (name, self.filename))
+        ds = self.file[name]
+        shape, dtype = ds.shape, ds.dtype
+        if block_grid is None:
+            block_grid = ds.chunks if ds.chunks is not None else sar_chunks(shape, dtype)
+        blocks = _grid_blocks(block_grid, shape)
+        workers = min(int(workers), len(blocks))
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        shared_memory = _optional_import('shared_memory')   # Python >= 3.8
+        if workers <= 1 or nbytes == 0 or shared_memory is None:
+            out = np.zeros(shape, dtype=dtype)
+            for ind in blocks:
+                ds.read_direct(out, ind, ind)
+            return out
+
+        self.file.flush()
+        out = np.zeros(shape, dtype=dtype)
+        slot_bytes = max(max(_index_size(ind) for ind in blocks) * dtype.itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=slot_bytes * workers)
+        try:
+            # spawned, not forked: a forked worker would inherit the open HDF5 file of this process
+            context = _lazy_import('multiprocessing').get_context('spawn')
+            with _lazy_import('ProcessPoolExecutor')(workers, mp_context=context,
+                                                     initializer=_hdf_read_init,
+                                                     initargs=(self.filename, shm.name)) as pool:
+                todo = iter(blocks)
+                pending = {}
+
+                def submit(slot):
+                    for ind in itertools.islice(todo, 1):
+                        job = pool.submit(_hdf_read_block, name, ind, slot * slot_bytes, dtype.str)
+                        pending[job] = ind, slot
+
+                for slot in range(workers):
+                    submit(slot)
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for job in done:
+                        ind, slot = pending.pop(job)
+                        job.result()
+                        out[ind] = np.ndarray(_index_shape(ind), dtype=dtype, buffer=shm.buf,
+                                              offset=slot * slot_bytes)
+                        submit(slot)
+        finally:
+            shm.close()
+            shm.unlink()
+        return out
+
+    def write(self, array, chunks=True, compression=None, shuffle=False, **kwargs):
+        """
+        Writes an array (or a list of arrays) into the datasets D1, D2, ... By default the datasets
+        are chunked in SAR-friendly tiles (see sar_chunks), so blocks of large arrays can be read
+        without touching whole lines. chunks=None gives contiguous datasets, compression (e.g.
+        'gzip' or 'lzf') and shuffle are the h5py filters.
+
+        With the block keyword (see read) the array(s) are written into a block of the existing
+        datasets instead.
+        """
+        lun = self._writable()
         if 'block' in kwargs:
-            print("ERROR: block write not yet implemented")
+            if not isinstance(array, list):
+                array = [array]
+            for k, arr in enumerate(array):
+                name = "D"+str(k+1)
+                if name not in lun:
+                    RatFile._ioerror('The dataset %s should have been written prior to block '
+                                     'writting!' % name)
+                arr = np.asarray(arr)
+                dataset = lun[name]
+                dataset[_block_index(kwargs['block'], dataset.shape, arr)] = arr
+            lun.flush()
+            return
 
-        for ds in self.file:
-            del self.file[ds]
+        for ds in lun:
+            del lun[ds]
         if not isinstance(array, list):
             array = [array]
         for k, arr in enumerate(array):
-            self.file.create_dataset("D"+str(k+1), data=arr)
+            self._create_dataset(lun, "D"+str(k+1), arr, chunks, compression, shuffle)
+        lun.flush()
 
-    def add(self, array, **kwargs):
+    def add(self, array, chunks=True, compression=None, shuffle=False, **kwargs):
         if not isinstance(array, list):
             array = [array]
+        lun = self._writable()
         n = 0
-        for ds in self.file:
+        for ds in lun:
             n += 1
         for k, arr in enumerate(array):
-            self.file.create_dataset("D"+str(k+n+1), data=arr)
+            self._create_dataset(lun, "D"+str(k+n+1), arr, chunks, compression, shuffle)
+        lun.flush()
+
+    def _create_dataset(self, lun, name, arr, chunks, compression, shuffle):
+        arr = np.asarray(arr)
+        if arr.ndim == 0 or arr.size == 0:
+            # scalars and empty arrays can't be chunked
+            return lun.create_dataset(name, data=arr)
+        options = {}
+        if chunks is True:
+            chunks = sar_chunks(arr.shape, arr.dtype)
+        if chunks is not None:
+            options['chunks'] = tuple(chunks)
+        if compression is not None:
+            options['compression'] = compression
+        if shuffle:
+            options['shuffle'] = True
+        return lun.create_dataset(name, data=arr, **options)
 
     def annotate(self, text, **kwargs):
-        self.file.attrs['annotation'] = text
+        lun = self._writable()
+        lun.attrs['annotation'] = text
+        lun.flush()
+        self.info = text
     
+    def keys(self):
+        return list(self.file)
+
+    def __len__(self):
+        return len(self.file)
+
+    def __getitem__(self, key):
+        """
+        Returns a lazy array-like proxy of a dataset, given by its name ('D2') or by its number
+        (1 for 'D2'). The data is read only when the proxy is sliced: hdfobj['D2'][100:200, :50]
+        """
+        if not isinstance(key, str):
+            key = "D"+str(int(key)+1)
+        if key not in self.file:
+            raise KeyError('Dataset "%s" not found in %s' % (key, self.filename))
+        return HDFdataset(self, key)
+
     def expose(self):
+        """
+        Returns the h5py datasets (opened for writing); they are valid until the instance is closed.
+        """
+        lun = self._writable()
         data = []
-        for ds in self.file:
-            data.append(self.file[ds])
+        for ds in lun:
+            data.append(lun[ds])
         if len(data) == 1:
             data = data[0]
         return data
 
-    def __del__(self):
-        if self.file is not None:
-            self.file.close()
+
+def _block_index(block, shape, arr=None):
+    """Get the index tuple of a block (RatFile conventions) for an array of given shape."""
+    block = check_block(block, shape, arr=arr)
+    return tuple(slice(int(x), int(y)) for x, y in zip(block[::2], block[1::2]))
+
+
+def _grid_blocks(block_grid, shape):
+    """Get the index tuples of a list of blocks or of the tiles of a grid (see read_parallel)."""
+    shape = tuple(int(n) for n in shape)
+    grid = np.atleast_1d(block_grid)
+    if grid.dtype == object or grid.ndim > 1:
+        return [_block_index(block, shape) for block in block_grid]
+    tile = [int(n) for n in grid]
+    if len(tile) == 1 and len(shape) > 1:
+        tile = tile * 2
+    if len(tile) == 2 and len(shape) > 2:
+        # 2 values are for the 2 largest axes, the other axes are not split
+        largest = sorted(range(len(shape)), key=lambda k: shape[k])[-2:]
+        tile = iter(tile)
+        tile = [next(tile) if k in largest else n for k, n in enumerate(shape)]
+    if len(tile) != len(shape) or min(tile) < 1:
+        RatFile._ioerror('The block grid %s does not fit the shape %s!' % (str(block_grid),
+                                                                          str(shape)))
+    starts = [range(0, n, t) for n, t in zip(shape, tile)]
+    return [tuple(slice(a, min(a + t, n)) for a, t, n in zip(start, tile, shape))
+            for start in itertools.product(*starts)]
+
+
+def _index_shape(ind):
+    """Get the shape of a block given as index tuple of slices (see _block_index)."""
+    return tuple(sl.stop - sl.start for sl in ind)
+
+
+def _index_size(ind):
+    """Get the number of elements of a block given as index tuple of slices."""
+    return int(np.prod(_index_shape(ind)))
+
+
+# the open file and shared memory of a worker process of HDFarray.read_parallel
+_hdf_worker = {}
+
+
+def _hdf_read_init(filename, shm_name):
+    """Initializer of the worker processes of HDFarray.read_parallel: open the file read-only and
+    attach the shared memory once per process."""
+    h5py = _lazy_import('h5py')
+    try:
+        lun = h5py.File(filename, 'r', swmr=True, locking=False)
+    except TypeError:                           # h5py < 3.5 has no locking keyword
+        lun = h5py.File(filename, 'r', swmr=True)
+    _hdf_worker['file'] = lun
+    _hdf_worker['shm'] = _lazy_import('shared_memory').SharedMemory(name=shm_name)
+
+
+def _hdf_read_block(name, ind, offset, dtype):
+    """Worker of HDFarray.read_parallel: read a block of a dataset into its shared memory slot."""
+    slot = np.ndarray(_index_shape(ind), dtype=np.dtype(dtype), buffer=_hdf_worker['shm'].buf,
+                      offset=offset)
+    _hdf_worker['file'][name].read_direct(slot, ind)
+    del slot
+
+
+class HDFdataset(object):
+    """
+    Lazy array-like proxy of a dataset in a STE-HDF5 file, as returned by HDFarray[...]. Supports
+    NumPy slicing (reading and writing only the selected part), np.asarray and the basic array
+    attributes.
+    """
+
+    def __init__(self, hdfobj, name):
+        self.hdfobj = hdfobj
+        self.name = name
+
+    @property
+    def dataset(self):
+        return self.hdfobj.file[self.name]
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, ind):
+        return self.dataset[ind]
+
+    def __setitem__(self, ind, value):
+        lun = self.hdfobj._writable()
+        lun[self.name][ind] = value
+        lun.flush()
+
+    def __array__(self, dtype=None):
+        arr = self.dataset[...]
+        return arr if dtype is None else arr.astype(dtype)
+
+    def read(self, block=None):
+        """Reads the dataset or a block of it (RatFile conventions)."""
+        if block is None:
+            return self.dataset[...]
+        return self.dataset[_block_index(block, self.shape)]
+
+    def __repr__(self):
+        return '<HDFdataset "%s" in %s: shape %s, dtype %s>' % (
+            self.name, self.hdfobj.filename, str(self.shape), self.dtype)
 
 
 def hdflist(filename):
@@ -195,22 +544,40 @@ def hdflist(filename):
     Lists the logical structure of a HDF5 file (h5py)
     """
     print("Structure of HDF5 file "+filename+":")
-    file = h5py.File(filename, "r")
+    for item in hdfinfo(filename):
+        print(("G " if item['type'] == 'group' else "D ") + item['path'])
 
-    def listme(hdobj):
-        for element in hdobj:
-            if isinstance(hdobj[element], h5py._hl.group.Group):
-                print("G " + hdobj[element].name)
-                listme(hdobj[element])
-            else:
-                print("D " + hdobj[element].name)
-    listme(file)
-    file.close()
+
+def hdfinfo(filename, as_json=False):
+    """
+    Describes all groups and datasets of a HDF5 file without reading any data. Returns a list
+    with a dictionary per object (path, type, shape, dtype, chunks, compression, storage_size =
+    bytes on disk, nbytes = bytes in memory), or with as_json=True the list as JSON string.
+    """
+    h5py = _lazy_import('h5py')
+    table = []
+
+    def visit(name, obj):
+        item = OrderedDict([('path', obj.name), ('type', 'group'), ('shape', None),
+                            ('dtype', None), ('chunks', None), ('compression', None),
+                            ('storage_size', None), ('nbytes', None)])
+        if isinstance(obj, h5py.Dataset):
+            item.update(type='dataset', shape=list(obj.shape), dtype=obj.dtype.str,
+                        chunks=list(obj.chunks) if obj.chunks is not None else None,
+                        compression=obj.compression, storage_size=int(obj.id.get_storage_size()),
+                        nbytes=int(obj.size) * obj.dtype.itemsize)
+        table.append(item)
+
+    with h5py.File(filename, "r") as lun:
+        lun.visititems(visit)
+    if as_json:
+        return json.dumps(table, indent=1)
+    return table
 
 
 def rrat(filename, **kwargs):
     """Read an entire RAT file, return it as a numpy array."""
-    rat_file = RatFile(filename)
+    rat_file = open_rat(filename)
     return rat_file.read(**kwargs)
 
 def mrrat(filename, **kwargs):
@@ -220,14 +587,46 @@ def mrrat(filename, **kwargs):
      function works faster than rrat, but the disadvantage is that the array is
      read-only.
     """
-    rat_file = RatFile(filename)
+    rat_file = open_rat(filename)
     return rat_file.mread(**kwargs)
 
+def irat(filename, rows=1024, overlap=0):
+    """Iterate over a RAT file in tiles along the first axis.
+
+    Yields ``(block, array)`` tuples, see ``RatFile.iter_blocks`` for details.
+    Convinient for running multilook or filter kernels over big files in
+    bounded memory.
+    """
+    rat_file = open_rat(filename)
+    return rat_file.iter_blocks(rows=rows, overlap=overlap)
+
 def srat(filename, array, **kwargs):
-    """Write a numpy ndarray into a RAT file."""
-    rat_file = RatFile(filename)
+    """Write a numpy ndarray into a RAT file.
+
+    With the ``compression`` keyword a compressed RAT-Z file is written, see
+    ``RatZFile.write``. Blocks are written in the format of the existing file.
+    """
+    if 'compression' in kwargs:
+        rat_file = RatZFile(filename)
+    elif 'block' in kwargs:
+        rat_file = open_rat(filename)
+    else:
+        rat_file = RatFile(filename)
     rat_file.write(array, **kwargs)
 
+def msrat(filename, shape=None, **kwargs):
+    """Open a RAT file as a writable memory map to the numpy array.
+
+    If ``shape`` is given, a new (sparse) file is created first, the data type
+    is then given by the ``dtype`` keyword (see ``RatFile.create``). Otherwise
+    the header of the existing file is used. Convinient for filling big
+    output files tile by tile.
+    """
+    rat_file = RatFile(filename)
+    if shape is not None:
+        rat_file.create(shape=shape, **kwargs)
+    return rat_file.mmap_writable()
+
 
 class RatHeaderRat(ctypes.Structure):
     """
@@ -469,6 +868,41 @@ class RatHeader(ctypes.Structure):
         self.Rat = RatHeaderRat(**kwargs)
 
 
+class RatHeaderZ(ctypes.Structure):
+    """Describes the chunks of a compressed ``RAT-Z`` file.
+
+    Stored directly after the ``RatHeader``; the chunk index (an offset and a
+    size for each chunk, as little-endian uint64) is stored at ``index_offset``
+    after the data of the chunks.
+
+    :param magic: ``b'RATZ'``
+    :param version: version of the ``RAT-Z`` layout
+    :param codec: compression codec, see ``ratz_codecs``
+    :param shuffle: 1 if the bytes of the samples are shuffled before
+      compression
+    :param chunk_rows: number of lines (along the first axis) per chunk
+    :param nchunks: number of chunks
+    :param index_offset: position of the chunk index in the file
+    """
+    _pack_ = 1
+    _fields_ = [("magic", ctypes.c_char * 4),
+                ("version", ctypes.c_int),
+                ("codec", ctypes.c_int),
+                ("shuffle", ctypes.c_int),
+                ("chunk_rows", ctypes.c_longlong),
+                ("nchunks", ctypes.c_longlong),
+                ("index_offset", ctypes.c_longlong),
+                ("reserved", ctypes.c_int * 6)]
+
+
+def open_rat(filename):
+    """Open a RAT file as ``RatFile`` or as ``RatZFile`` if it is compressed."""
+    rat_file = RatFile(filename)
+    if rat_file.exists and rat_file.Header.Rat.reserved[0] == ratz_magic:
+        rat_file = RatZFile(filename)
+    return rat_file
+
+
 class RatFile():
     """    Class for manipulating RAT formatted files."""
 
@@ -491,8 +925,7 @@ class RatFile():
         # the shape of numpy array
         self.shape = ()
         try:
-            self.version, self.xdrflag = self.get_version()
-            self.read_header()
+            self._load_header()
             self.shape = self._get_shape()
             self.ndim = len(self.shape)
             self.dtype = self._get_dtype()
@@ -503,6 +936,15 @@ class RatFile():
         except (IOError, IndexError):
             self.exists = False
 
+    def close(self):
+        """Close the pooled handles of the file (they are reopened when needed)."""
+        _handle_pool_drop(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     @classmethod
     def _ioerror(cls, msg):
@@ -566,12 +1008,81 @@ class RatFile():
             self.Header.Rat.rattype = ctypes.c_int(kwargs['rattype'])
 
         # write the Header and truncate the file
+        _header_cache_drop(self.filename)
+        _handle_pool_drop(self.filename)
         with open(self.filename, 'wb') as lun:
             lun.write(self.Header)
             self.exists = True
+        self.version, self.xdrflag = 2.0, 0
 
         return self
 
+    def mmap_writable(self):
+        """Map the data array of the file as a writable ``numpy.memmap``.
+
+        The header should have been written before (e.g. by ``create``). If
+        the file is shorter than given by the header, it is extended to its
+        full size first (as a sparse file where supported). Disjoint tiles of
+        the returned array can then be filled by several workers without any
+        further system calls; call ``flush`` on the array when done.
+
+        :return: numpy.memmap
+
+        :raises: IOError if the file doesn't exist.
+        """
+        if self.exists == False:
+            self._ioerror('ERROR: The file "%s" does not exist'%self.filename)
+        return self._memmap_rows(0, self.shape[0])
+
+    def _memmap_rows(self, first, last):
+        """Map the lines ``first:last`` of the data array writable."""
+        offset = self._data_offset()
+        row_bytes = self.dtype.itemsize * int(np.prod(self.shape[1:]))
+        n_bytes = offset + row_bytes * int(self.shape[0])
+        with open(self.filename, 'r+b') as lun:
+            if os.fstat(lun.fileno()).st_size < n_bytes:
+                lun.truncate(n_bytes)
+        return np.memmap(self.filename, dtype=self._file_dtype(), mode='r+',
+                         offset=offset + row_bytes * first,
+                         shape=(last - first,) + tuple(self.shape[1:]))
+
+    def _block_data(self, arr, block):
+        """Quantize (for quantized files) and check an array to be written
+        into a block; returns the array and the checked block."""
+        quant = self._quantization()
+        if quant is not None and arr.dtype == dtype_dict.get(quant[1]):
+            arr = quantize_array(arr, *quant)[0]
+        # check if datatype of arr and of 'var' are the same
+        self._check_dtypes(arr)
+        # check if the block var meets the requirements
+        block = self._check_block(block, arr=arr)
+        return arr, block
+
+    def _pwrite_block(self, fd, arr, block):
+        """Write a checked block with positioned writes on an open file
+        descriptor, one write per contiguous run in the file. No other
+        descriptor of the file is opened (closing one would drop the
+        ``fcntl`` locks of the process)."""
+        shape = [int(n) for n in self.shape]
+        block = [int(b) for b in block]
+        if arr.size == 0:
+            return
+        # the axes after ``last`` are written completely, so the data along
+        # them is contiguous in the file
+        last = len(shape) - 1
+        while last > 0 and block[2 * last] == 0 and block[2 * last + 1] == shape[last]:
+            last -= 1
+        strides = [self.dtype.itemsize * int(np.prod(shape[k + 1:])) for k in range(len(shape))]
+        arr = np.ascontiguousarray(arr, dtype=self._file_dtype())
+        offset = self._data_offset() + block[2 * last] * strides[last]
+        outer = [range(a, b) for a, b in zip(block[:2 * last:2], block[1:2 * last:2])]
+        for idx in itertools.product(*outer):
+            pos = offset + sum(i * st for i, st in zip(idx, strides))
+            data = memoryview(arr[tuple(i - a for i, a in zip(idx, block[::2]))].reshape(-1).view(np.uint8))
+            while len(data) > 0:
+                n = _pwrite(fd, data, pos)
+                data, pos = data[n:], pos + n
+
     @property
     def n_bytes_total(self):
         return 1000 + self.dtype.itemsize * np.int64(self.shape).prod()
@@ -598,10 +1109,11 @@ class RatFile():
         command, where ``rat`` is a ``RatFile`` instance and ``header`` is a
         ``RatHeader`` instance.
 
-        Using a ``block`` keyword for 2D arrays the offset in both axes is
-        possible (i.e. if the shape specified in header is [100,200], then a
-        block can be equal to [20,50, 130, 200]). In other cases only an offset
-        along the first axis is supported. The data type of the ``arr`` should
+        Using a ``block`` keyword an offset along all the axes is possible (i.e.
+        if the shape specified in header is [100,200], then a block can be
+        equal to [20,50, 130, 200]). Only the bytes of the block are written,
+        the rest of the file is left unchanged, so several writers can fill
+        disjoint blocks of one file. The data type of the ``arr`` should
         correspond to the one given in previously written ``header``, otherwise
         an error will be raised.
 
@@ -621,6 +1133,13 @@ class RatFile():
           :param rattype: numpy.dtype or a string
           :param rattype: specifies RAT file type
           :type rattype: int
+          :param quantize: store the data with reduced precision, one of
+            ``'float16'`` (float or complex data), ``'int16-log'`` (positive
+            data like intensities, stored logarithmically) or
+            ``'phase-uint16'`` (phases in radians). The parameters are kept in
+            the reserved fields of the header (marked by ``quantize_magic``)
+            and ``read`` restores the data. Block writes into a quantized file are quantized likewise.
+          :type quantize: string
 
 
         :raises: IOError
@@ -633,41 +1152,30 @@ class RatFile():
 
         # block writing
         if 'block' in kwargs:
-            # check if datatype of arr and of 'var' are the same
-            self._check_dtypes(arr)
-
-            block = kwargs['block']
-            # check if the block var meets the requirements
-            block = self._check_block(block, arr=arr)
+            arr, block = self._block_data(arr, kwargs['block'])
 
             if 'header' in kwargs:
                 self._ioerror('The header should have been written prior to block '
                               'writting!')
 
-            # for 2D arrays an offset for both axes is allowed
-            if arr.ndim == 2:
-                # create zero-filled numpy array of self.shape
-                # and fill it with arr.data corresponding to block array values
-                temp = np.zeros(
-                    [arr.shape[0], self.shape[1]], dtype=arr.dtype)
-                temp[:, block[2]:block[3]] = arr
-                arr = temp
-                offset = 1000 + np.int64(self.shape[1]) * block[0] * arr.itemsize
-
-            else:
-                offset = 1000 + np.ravel_multi_index(
-                    block[::2], self.shape) * arr.itemsize
-
-            with open(self.filename, 'r+') as lun:
-                # The header should be written prior block writting
-                lun.seek(offset)
-                arr.tofile(lun)
-                lun.flush()
-                self.exists = True
+            if arr.size == 0:
+                return
+            # map only the lines spanned by the block and paste the tile, so
+            # the neighbouring data in the file is not touched
+            ind = tuple(map(
+                lambda x, y: slice(x, y, None), block[::2], block[1::2]))
+            mm = self._memmap_rows(int(block[0]), int(block[1]))
+            mm[(slice(None),) + ind[1:]] = arr
+            mm.flush()
+            del mm
             return
 
         # no block writing
         else:
+            quant = None
+            if 'quantize' in kwargs and arr.size > 0:
+                arr, quant = quantize_array(arr, kwargs['quantize'])
+
             if 'header' in kwargs:
                 self.Header = kwargs['header']
                 # modify existing header if needed
@@ -683,6 +1191,8 @@ class RatFile():
                     self.Header.Rat.var = get_var(data_type)
                 if 'rattype' in kwargs:
                     self.Header.Rat.rattype = kwargs['rattype']
+                if quant is not None:
+                    self.Header.Rat.var = get_var(arr.dtype)
                 # check if datatypes of array and header are equal
                 if arr.size > 0:
                     self._check_dtypes(arr)
@@ -691,7 +1201,7 @@ class RatFile():
                 # parse array parameters to the Header
                 self.Header = RatHeader(
                     shape=(arr.shape if 'shape' not in kwargs else kwargs['shape']),
-                    var=np.ctypeslib.array(get_var(arr.dtype)))
+                    var=get_var(arr.dtype).value)
                 if 'rattype' in kwargs:
                     self.Header.Rat.rattype = kwargs['rattype']
 
@@ -702,66 +1212,108 @@ class RatFile():
             self.shape = self._get_shape()
             self.Header.Rat.ndim = ctypes.c_int(len(self.shape))
             self.Header.Rat.nchannel = ctypes.c_int(int(np.product(self.shape[2:])))
+            self._set_quantization(quant)
 
+            _header_cache_drop(self.filename)
+            _handle_pool_drop(self.filename)
             with open(self.filename, 'wb') as lun:
                 lun.write(self.Header)
                 if arr.size > 0:
                     arr.tofile(lun)
                 self.exists = True
+                self.version, self.xdrflag = 2.0, 0
                 if lun.tell() > self.n_bytes_total:
                     warnings.warn("The size of the RAT file exceed! The array "
                                   "is written outside the header's dimensions!")
                 lun.flush()
             return
     # --------------------------------------------------------------------------
-    def read(self, **kwargs):
+    def read(self, out=None, workers=1, stats=None, dequantize=True, **kwargs):
         """Read the data from ``RAT`` file as a numpy array.
 
         Works both with ``RAT`` 1.0 and 2.0 files, allows to read the data in
-        blocks along all the axes.
+        blocks along all the axes. Data written with reduced precision (see
+        the ``quantize`` keyword of ``write``) is restored unless
+        ``dequantize=False``; ``out`` then receives the stored values.
+
+        The data is copied only once: blocks which are contiguous on disk (all
+        axes except the first one are read completely) are read directly into
+        the output array, other blocks are copied from a memory map. The byte
+        order of big-endian (XDR) files is swapped in place.
+
+        :param out: optional preallocated output array; it must have the shape
+          of the block and the native data type of the file.
+        :type out: numpy.ndarray
+        :param workers: number of threads reading concurrently; the block is
+          split into ranges along the first axis which are filled with
+          ``os.preadv`` (or copied from the memory map) in parallel.
+        :type workers: int
+        :param stats: optional ``ReadStats`` instance, which is updated with the
+          number of bytes read and the time spent.
+        :type stats: ReadStats
 
         **Keywords**:
           :param block: the block of data to read;
             ``block=[start_1, stop_1, ..., ..., start_N, stop_N]``, where ``N``
             is a number of axes.
+          :param decimate: read only every n-th sample along the axes;
+            ``decimate=[step_1, ..., step_N]``. As for ``block``, two values
+            for a >2D file are applied to the two largest axes. Only the
+            needed lines are touched on disk.
 
         :return: numpy.ndarray
 
         :raises: IOError if the file doesn't exist, if ``RAT`` version is not
-          recognized and when ``block`` doesn't correspond to the shape of
-          ``RAT`` header.
+          recognized, when ``block`` doesn't correspond to the shape of
+          ``RAT`` header and when ``out`` doesn't fit the block.
         """
         if self.exists == False:
             self._ioerror('ERROR: The file "%s" does not exist'%self.filename)
-        if 'block' in kwargs:
-            block = kwargs['block']
-            # check if the block var meets the requirements
-            block = self._check_block(block)
-        else:
-            block = np.zeros(2 * len(self.shape), dtype=np.int)
-            block[1::2] = self.shape
-
-        ind = tuple(map(
-            lambda x, y: slice(x, y, None), block[::2], block[1::2]))
-
-        if self.version == 2.0:
-            offset = 1000
-        elif self.version == 1.0:
-            offset = int(104 + 4 * self.Header.Rat.ndim + 4 * self.xdrflag)
-        else:
-            self._ioerror('ERROR: RAT version not supported')
-
-        with open(self.filename, 'rb') as lun:
-            mm = mmap.mmap(
-                lun.fileno(), length=0, access=mmap.ACCESS_READ)
-
-            arr = (np.ndarray.__new__(np.ndarray, self.shape, dtype=self.dtype,
-                                      buffer=mm, offset=offset)[ind])
+        block, steps, ind = self._get_index(**kwargs)
+        shape = tuple(int(x) for x in -((block[::2] - block[1::2]) // steps))
+
+        out = self._prepare_out(out, shape)
+
+        t0 = time.time()
+        row_ranges = np.array_split(np.arange(shape[0]), max(min(workers, shape[0]), 1))
+        row_ranges = [(int(r[0]), int(r[-1]) + 1) for r in row_ranges if len(r) > 0]
+        contiguous = (all(steps == 1) and all(block[2::2] == 0) and
+                      all(block[3::2] == self.shape[1:]))
+        if contiguous and out.flags.c_contiguous and out.size > 0:
+            row_bytes = self.dtype.itemsize * int(np.prod(self.shape[1:]))
+            offset = self._data_offset() + int(block[0]) * row_bytes
+            if hasattr(os, 'preadv'):
+                with _pooled_handle('fd', self.filename) as fd:
+                    if len(row_ranges) > 1:
+                        with ThreadPoolExecutor(len(row_ranges)) as pool:
+                            jobs = [pool.submit(self._preadinto, fd, out[a:b],
+                                                offset + a * row_bytes)
+                                    for a, b in row_ranges]
+                            for job in jobs:
+                                job.result()
+                    else:
+                        self._preadinto(fd, out, offset)
+            else:
+                with open(self.filename, 'rb', buffering=0) as lun:
+                    lun.seek(offset)
+                    self._readinto(lun, out)
             if self.xdrflag == 1:
-                arr = arr.byteswap()
-        arr_new = np.zeros(shape=arr.shape, dtype=arr.dtype)
-        arr_new[:] = arr
-        return arr_new
+                out.byteswap(inplace=True)
+        else:
+            arr = self._mmap_array()[ind]
+            if len(row_ranges) > 1:
+                with ThreadPoolExecutor(len(row_ranges)) as pool:
+                    jobs = [pool.submit(np.copyto, out[a:b], arr[a:b])
+                            for a, b in row_ranges]
+                    for job in jobs:
+                        job.result()
+            else:
+                np.copyto(out, arr)
+        if stats is not None:
+            stats.add(out.nbytes, time.time() - t0)
+        if dequantize:
+            return self._dequantize(out)
+        return out
 
     # --------------------------------------------------------------------------
     def mread(self, **kwargs):
@@ -769,12 +1321,20 @@ class RatFile():
         map (attention: the array is opened in read-only mode).
 
         Works both with ``RAT`` 1.0 and 2.0 files, allows to read the data in
-        blocks along all the axes.
+        blocks along all the axes. The data is never copied: for big-endian
+        (XDR) files the returned view has a non-native data type (e.g.
+        ``'>c8'``), which numpy converts on the fly. Quantized data is
+        returned as stored (of type ``dtype`` instead of ``data_dtype``), a
+        warning is issued in this case.
 
         **Keywords**:
           :param block: the block of data to read;
             ``block=[start_1, stop_1, ..., ..., start_N, stop_N]``, where ``N``
             is a number of axes.
+          :param decimate: read only every n-th sample along the axes;
+            ``decimate=[step_1, ..., step_N]``. As for ``block``, two values
+            for a >2D file are applied to the two largest axes. Only the
+            needed lines are touched on disk.
 
         :return: numpy.ndarray
 
@@ -784,33 +1344,166 @@ class RatFile():
         """
         if self.exists == False:
             self._ioerror('ERROR: The file is not found')
-        if 'block' in kwargs:
-            block = kwargs['block']
-            # check if the block var meets the requirements
-            block = self._check_block(block)
-        else:
-            block = np.zeros(2 * len(self.shape), dtype=np.int)
-            block[1::2] = self.shape
+        block, steps, ind = self._get_index(**kwargs)
+        self._warn_quantized()
 
-        ind = tuple(map(
-            lambda x, y: slice(x, y, None), block[::2], block[1::2]))
+        return self._mmap_array()[ind]
 
-        if self.version == 2.0:
-            offset = 1000
-        elif self.version == 1.0:
-            offset = int(104 + 4 * self.Header.Rat.ndim + 4 * self.xdrflag)
-        else:
-            self._ioerror('ERROR: RAT version not supported')
+    def iter_blocks(self, rows=1024, overlap=0):
+        """Iterate over the file in tiles of ``rows`` lines along the first axis.
 
-        with open(self.filename, 'rb') as lun:
-            mm = mmap.mmap(
-                lun.fileno(), length=0, access=mmap.ACCESS_READ)
+        Each tile is a read-only view on a memory map of the file (the same
+        as returned by ``mread``), so only the pages touched by the caller are
+        actually read from disk. Tiles of quantized files are dequantized
+        into new arrays of type ``data_dtype``. Consecutive tiles share ``overlap`` lines on
+        each side, which allows to run filter kernels without edge effects.
+        The tiles are clipped at the borders of the array.
 
-            arr = (np.ndarray.__new__(np.ndarray, self.shape, dtype=self.dtype,
-                                      buffer=mm, offset=offset)[ind])
-            if self.xdrflag == 1:
-                arr = arr.byteswap()
-        return arr
+        :param rows: number of lines per tile (without the overlap)
+        :type rows: int
+        :param overlap: number of additional lines read before and after each
+          tile
+        :type overlap: int
+
+        :return: generator of ``(block, array)`` tuples, where ``block`` is
+          ``[start_1, stop_1, ..., start_N, stop_N]`` of the returned array
+          (including the overlap)
+
+        :raises: IOError if the file doesn't exist or the parameters are
+          invalid.
+        """
+        if self.exists == False:
+            self._ioerror('ERROR: The file "%s" does not exist'%self.filename)
+        if rows < 1 or overlap < 0:
+            self._ioerror('rows must be positive and overlap nonnegative!')
+
+        arr = self._mmap_array()
+        quant = self._quantization()
+        for block in self._row_blocks(rows, overlap):
+            tile = arr[block[0]:block[1]]
+            if quant is not None:
+                tile = self._dequantize(np.ascontiguousarray(tile))
+            yield block, tile
+
+    def prefetching_blocks(self, rows=1024, overlap=0, workers=1, stats=None):
+        """Iterate over the file in tiles, reading the next tile in background.
+
+        Works like ``iter_blocks``, but the tiles are read into memory (using
+        ``read``) by a background thread: while the caller processes tile
+        ``k``, tile ``k+1`` is already being read, so the disk does not idle
+        during the computation.
+
+        :param rows: number of lines per tile (without the overlap)
+        :type rows: int
+        :param overlap: number of additional lines read before and after each
+          tile
+        :type overlap: int
+        :param workers: number of threads used to read each tile
+        :type workers: int
+        :param stats: optional ``ReadStats`` instance; besides the bytes and the
+          time spent reading, it gets the time the caller waited for data
+          (``wait``), so ``stats.hidden`` gives the hidden I/O time.
+        :type stats: ReadStats
+
+        :return: generator of ``(block, array)`` tuples
+
+        :raises: IOError if the file doesn't exist or the parameters are
+          invalid.
+        """
+        if self.exists == False:
+            self._ioerror('ERROR: The file "%s" does not exist'%self.filename)
+        if rows < 1 or overlap < 0:
+            self._ioerror('rows must be positive and overlap nonnegative!')
+
+        blocks = list(self._row_blocks(rows, overlap))
+        if len(blocks) == 0:
+            return
+        with ThreadPoolExecutor(1) as pool:
+            job = pool.submit(self.read, block=blocks[0], workers=workers,
+                              stats=stats)
+            for k, block in enumerate(blocks):
+                t0 = time.time()
+                arr = job.result()
+                if stats is not None:
+                    stats.wait += time.time() - t0
+                if k + 1 < len(blocks):
+                    job = pool.submit(self.read, block=blocks[k + 1],
+                                      workers=workers, stats=stats)
+                yield block, arr
+
+    def _row_blocks(self, rows, overlap):
+        """Generate the blocks of tiles along the first axis."""
+        n_rows = self.shape[0]
+        for start in range(0, n_rows, rows):
+            first = max(start - overlap, 0)
+            last = min(start + rows + overlap, n_rows)
+            block = [first, last]
+            for dim in self.shape[1:]:
+                block += [0, dim]
+            yield block
+
+    def read_multilooked(self, looks=(1, 1), mode='mean'):
+        """Read the data block-averaged (multilooked) directly from the file.
+
+        The file is streamed through a memory map in chunks of lines, so the
+        memory needed is proportional to the output and not to the full
+        resolution data. Incomplete looks at the end of the axes are dropped,
+        like for a reshape-mean.
+
+        :param looks: number of looks along the axes; as for ``decimate`` two
+          values for a >2D file are applied to the two largest axes.
+        :type looks: list
+        :param mode: ``'mean'`` averages the values (the amplitude for complex
+          data), ``'intensity'`` averages the squared magnitude and
+          ``'complex'`` averages complex data coherently.
+        :type mode: string
+
+        :return: numpy.ndarray
+
+        :raises: IOError if the file doesn't exist or the parameters are
+          invalid.
+        """
+        if self.exists == False:
+            self._ioerror('ERROR: The file "%s" does not exist'%self.filename)
+        if mode not in ('mean', 'intensity', 'complex'):
+            self._ioerror('Unknown multilook mode "%s"!' % mode)
+        quant = self._quantization()
+        dtype = self.data_dtype
+        is_complex = dtype.kind == 'c'
+        if mode == 'complex' and not is_complex:
+            self._ioerror('Complex multilooking needs complex data!')
+
+        looks = self._check_decimate(looks, name='looks')
+        out_shape = tuple(int(n) // l for n, l in zip(self.shape, looks))
+        if mode == 'complex':
+            out_dtype = np.result_type(dtype, np.complex64)
+            acc_dtype = np.complex128
+        else:
+            out_dtype = np.result_type(np.zeros(0, dtype).real, np.float32)
+            acc_dtype = np.float64
+        out = np.empty(out_shape, dtype=out_dtype)
+
+        arr = self._mmap_array()
+        crop = tuple(slice(0, o * l) for o, l in zip(out_shape[1:], looks[1:]))
+        # interleave the output and the looks axes for the reshape-mean
+        ml_shape = [x for ol in zip(out_shape, looks) for x in ol]
+        ml_axes = tuple(range(1, 2 * len(looks), 2))
+
+        # process ~64 MB of input data per chunk
+        line_bytes = looks[0] * self.dtype.itemsize * int(np.prod(self.shape[1:]))
+        chunk = max(1, (64 << 20) // max(line_bytes, 1))
+        for k in range(0, out_shape[0], chunk):
+            k1 = min(k + chunk, out_shape[0])
+            tile = arr[(slice(k * looks[0], k1 * looks[0]),) + crop]
+            if quant is not None:
+                tile = self._dequantize(np.ascontiguousarray(tile))
+            if mode == 'intensity':
+                tile = tile.real ** 2 + tile.imag ** 2 if is_complex else tile ** 2
+            elif mode == 'mean' and is_complex:
+                tile = np.abs(tile)
+            ml_shape[0] = k1 - k
+            out[k:k1] = tile.reshape(ml_shape).mean(axis=ml_axes, dtype=acc_dtype)
+        return out
 
     def append(self, arr):
         """Append the ``RAT`` file with a given array along the first axis.
@@ -844,40 +1537,63 @@ class RatFile():
 
     # --------------------------------------------------------------------------
     def read_header(self):
-        # reading the version
-        self.version = self.get_version()[0]
         """Read ``RAT`` header; supports both ``RAT`` 1.0 and 2.0 versions."""
-        if self.version == 2.0:
-            with open(self.filename, 'rb') as lun:
-                lun.readinto(self.Header)
+        with open(self.filename, 'rb') as lun:
+            raw = lun.read(1000)
+        self.version, self.xdrflag, self.Header = self._parse_header(raw)
+        self.dtype = self._get_dtype()
 
-        elif self.version == 1.0:
-            warnings.warn('Old RAT v1.0 format!')
-            if self.xdrflag == 1:
-                data_type = '>i4'
-                offset = 4 * 4
-            else:
-                data_type = '<i4'
-                offset = 3 * 4
+    def _parse_header(self, raw):
+        """Parse version, XDR flag and header from the first bytes of a file."""
+        version, xdrflag = self._parse_version(raw)
+        if version == 2.0:
+            if len(raw) < ctypes.sizeof(RatHeader):
+                self._ioerror('ERROR: Incomplete RAT header in "%s"' % self.filename)
+            header = RatHeader.from_buffer_copy(raw)
 
-            with open(self.filename, 'rb') as lun:
-                ndim = int(np.fromfile(file=lun, dtype=data_type, count=1))
-                shape = np.fromfile(file=lun, dtype=data_type, count=ndim).tolist()
-                shape = shape[::-1]  
-                var = int(np.fromfile(file=lun, dtype=data_type, count=1))
-                rattype = int(np.fromfile(file=lun, dtype=data_type, count=1))
-                lun.seek(offset, 1)
-                info = np.fromfile(file=lun, dtype="B", count=80).tostring().rstrip()
+        elif version == 1.0:
+            warnings.warn('Old RAT v1.0 format!')
+            # XDR files have one more reserved integer before the info
+            endian = '>' if xdrflag == 1 else '<'
+            ndim = int(np.frombuffer(raw, dtype=endian + 'i4', count=1)[0])
+            v1_dtype = np.dtype([('ndim', endian + 'i4'),
+                                 ('shape', endian + 'i4', (ndim,)),
+                                 ('var', endian + 'i4'),
+                                 ('rattype', endian + 'i4'),
+                                 ('reserved', endian + 'i4', (3 + xdrflag,)),
+                                 ('info', 'S80')])
+            if len(raw) < v1_dtype.itemsize:
+                self._ioerror('ERROR: Incomplete RAT header in "%s"' % self.filename)
+            fields = np.frombuffer(raw, dtype=v1_dtype, count=1)[0]
+            shape = fields['shape'].tolist()[::-1]
+            var = int(fields['var'])
+            rattype = int(fields['rattype'])
+            info = fields['info'].rstrip()
 
             # initialize the header
-            self.Header = RatHeader(shape=shape, ndim=ndim, var=var,
-                                    rattype=rattype)
-            self.Header.Info.info = info
+            header = RatHeader(shape=shape, ndim=ndim, var=var,
+                               rattype=rattype)
+            header.Info.info = info
 
         else:
             self._ioerror('ERROR: RAT version not supported')
 
-        self.dtype = self._get_dtype()
+        return version, xdrflag, header
+
+    def _load_header(self):
+        """Read version and header of the file, using the header cache."""
+        key = os.path.abspath(self.filename)
+        st = os.stat(key)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = _header_cache_get(key, stamp)
+        if cached is None:
+            self.read_header()
+            _header_cache_put(key, stamp,
+                              (self.version, self.xdrflag, bytes(self.Header)))
+        else:
+            self.version, self.xdrflag, raw = cached
+            self.Header = RatHeader.from_buffer_copy(raw)
+            self.dtype = self._get_dtype()
 
     #--------------------------------------------------------------------------
 
@@ -899,7 +1615,8 @@ class RatFile():
                 f.write('sensor type     = %s\n' % sensorType)
 
     def write_geo_envi_header(self):
-            tmpl = Template(resource_string(__package__+'.templates', 'envihdr.tpl'))
+            resource_string = _lazy_import('resource_string')
+            tmpl = _lazy_import('Template')(resource_string(__package__+'.templates', 'envihdr.tpl'))
             envi_hdr = tmpl.render(file=self.filename, hdr=self.Header)
             with open(self.filename+'.hdr','w') as f:
                 f.write(envi_hdr)
@@ -925,15 +1642,20 @@ class RatFile():
 
     def get_version(self):
         """Get the version of ``RAT`` file: 1.0 or 2.0."""
-        Header = RatHeader()
-        magiclong = Header.Rat.magiclong
-        magicreal = 0
-
         with open(self.filename, 'rb') as lun:
-            magicreal = np.fromfile(file=lun, dtype="i4", count=1)
+            raw = lun.read(8)
+        return self._parse_version(raw)
+
+    @staticmethod
+    def _parse_version(raw):
+        """Get version and XDR flag from the first bytes of a file."""
+        if len(raw) < 8:
+            print(red + "ERROR: format not recognised!" + endc)
+            return False, False
+        magiclong = RatHeaderRat().magiclong
+        magicreal = np.frombuffer(raw, dtype="i4", count=1)[0]
         if magicreal != magiclong:  # Check if maybe we have a RAT V1 File...
-            with open(self.filename, 'rb') as lun:
-                ndim = np.fromfile(file=lun, dtype="<i4", count=1)
+            ndim = np.frombuffer(raw, dtype="<i4", count=1)[0]
             xdrflag = 0
             if ndim < 0 or ndim > 9:
                 ndim = ndim.byteswap()
@@ -943,47 +1665,103 @@ class RatFile():
                 return False, False
             version = 1.0
         else:  #-------------- Yeah, RAT 2.0 found
-            with open(self.filename, 'rb') as lun:
-                lun.seek(4)
-                version = np.fromfile(file=lun, dtype="float32", count=1)[0]
+            version = np.frombuffer(raw, dtype="float32", count=1, offset=4)[0]
             xdrflag = 0
 
         return version, xdrflag
 
     def _check_block(self, block, **kwargs):
-        if len(block) == 4:                        # only 2D block provided
-            block = list(block)
+        return check_block(block, self.shape, arr=kwargs.get('arr'))
+
+    def _check_decimate(self, decimate, name='decimate'):
+        """Expand ``decimate`` (or ``looks``) to a step for every axis."""
+        decimate = [int(d) for d in np.atleast_1d(decimate)]
+        if len(decimate) == 1 and len(self.shape) > 1:
+            decimate = decimate * 2
+        if len(decimate) == 2 and len(self.shape) > 2:
+            # like in _check_block: 2 values are for the 2 largest axes
             dimlist = list(self.shape)
             dimlist[dimlist.index(max(dimlist))] = 0
             dimlist[dimlist.index(max(dimlist))] = 0
             for k, dim in enumerate(dimlist):
                 if dim != 0:
-                    block.insert(k*2, dim)
-                    block.insert(k*2, 0)
-
-        stop_more_than_shape = map(lambda x, y: (x > y), block[1::2], self.shape)
-        if any(stop_more_than_shape):
-            self._ioerror('Value of block exceeds the array shape!')
-
-        block = np.asarray(block)
-        if block.dtype.kind not in ('i','u'):
-            self._ioerror('Block extent must be given by integers!')
+                    decimate.insert(k, 1)
+        if len(decimate) != len(self.shape):
+            self._ioerror('The dimensions of %s do not correspond to the '
+                          'dimensions of the array!' % name)
+        if min(decimate) < 1:
+            self._ioerror('The items in %s must be positive!' % name)
+        return np.asarray(decimate)
+
+    def _get_index(self, **kwargs):
+        """Get block, steps and the index tuple from ``block``/``decimate``."""
+        if 'block' in kwargs:
+            block = kwargs['block']
+            # check if the block var meets the requirements
+            block = self._check_block(block)
+        else:
+            block = np.zeros(2 * len(self.shape), dtype=int)
+            block[1::2] = self.shape
 
-        if np.min(block) < 0:
-            self._ioerror('The items in block must be nonnegative!')
+        if 'decimate' in kwargs:
+            steps = self._check_decimate(kwargs['decimate'])
+        else:
+            steps = np.ones(len(self.shape), dtype=int)
 
-        if 'arr' in kwargs:
-            if len(block) // 2 != kwargs['arr'].ndim:
-                self._ioerror('The dimensions of block do not correspond to the '
-                              'dimensions of array!')
+        ind = tuple(map(
+            lambda x, y, z: slice(x, y, z), block[::2], block[1::2], steps))
+        return block, steps, ind
+
+    def _quantization(self):
+        """Get ``(mode, var, scale, offset)`` of quantized data or ``None``."""
+        mode = self.Header.Rat.reserved[1]
+        if (self.Header.Rat.reserved[5] != quantize_magic or
+                mode not in quantize_modes.values() or
+                self.Header.Rat.reserved[2] not in dtype_dict):
+            return None
+        name = [k for k, v in quantize_modes.items() if v == mode][0]
+        scale, offset = np.array(self.Header.Rat.reserved[3:5], dtype=np.int32).view(np.float32)
+        return name, self.Header.Rat.reserved[2], float(scale), float(offset)
 
-            block_not_shape = map(lambda x, y, z: (x - y) != z,
-                                  block[1::2], block[::2],
-                                  kwargs['arr'].shape)
-            if any(block_not_shape):
-                self._ioerror('Length of block components %s does not correspond to'
-                              ' the shape of the array %s!'%(str(block),str(kwargs['arr'].shape)))
-        return block
+    @property
+    def data_dtype(self):
+        """Data type of the arrays returned by ``read``: equal to ``dtype``
+        except for quantized files, for which ``dtype`` is the stored type."""
+        quant = self._quantization()
+        return self.dtype if quant is None else np.dtype(dtype_dict[quant[1]])
+
+    def _warn_quantized(self):
+        """Warn that the raw codes of a quantized file are returned."""
+        if self._quantization() is not None:
+            warnings.warn('"%s" is quantized, the stored %s codes are returned '
+                          'instead of the %s data! Use read to get the data.'
+                          % (self.filename, self.dtype, self.data_dtype))
+
+    def _set_quantization(self, quant):
+        """Store the quantization parameters in the reserved header fields."""
+        if quant is None:
+            self.Header.Rat.reserved[1:6] = [0, 0, 0, 0, 0]
+        else:
+            bits = np.array(quant[2:], dtype=np.float32).view(np.int32)
+            self.Header.Rat.reserved[1:6] = [quantize_modes[quant[0]], quant[1],
+                                             int(bits[0]), int(bits[1]), quantize_magic]
+
+    def _dequantize(self, arr):
+        """Restore quantized data, other data is returned unchanged."""
+        quant = self._quantization()
+        if quant is None:
+            return arr
+        return dequantize_array(arr, *quant)
+
+    def _prepare_out(self, out, shape):
+        """Allocate the output array of a read or check the given one."""
+        if out is None:
+            return np.empty(shape, dtype=self.dtype)
+        if out.shape != shape or out.dtype != self.dtype:
+            self._ioerror('The output array (%s, %s) does not correspond to the '
+                          'block (%s, %s)!' % (str(out.shape), out.dtype,
+                                               str(shape), self.dtype))
+        return out
 
     def _check_dtypes(self, arr):
         """Check if dtypes of given array and the one in header are equal"""
@@ -1007,6 +1785,1021 @@ class RatFile():
         shape = shape[:self.Header.Rat.ndim]
         return tuple(shape[::-1])
 
+    def _data_offset(self):
+        """Get the offset of the data in bytes, depending on ``RAT`` version."""
+        if self.Header.Rat.reserved[0] == ratz_magic:
+            self._ioerror('ERROR: "%s" is a compressed RAT-Z file, use RatZFile '
+                          'or open_rat' % self.filename)
+        if self.version == 2.0:
+            return 1000
+        elif self.version == 1.0:
+            return int(104 + 4 * self.Header.Rat.ndim + 4 * self.xdrflag)
+        else:
+            self._ioerror('ERROR: RAT version not supported')
+
+    def _readinto(self, lun, arr):
+        """Fill a contiguous array from the current position of a file."""
+        buf = memoryview(arr.reshape(-1).view(np.uint8))
+        pos = 0
+        while pos < len(buf):
+            n = lun.readinto(buf[pos:])
+            if not n:
+                self._ioerror('ERROR: Unexpected end of file "%s"' % self.filename)
+            pos += n
+
+    def _preadinto(self, fd, arr, offset):
+        """Fill a contiguous array from a file descriptor at a given offset."""
+        buf = memoryview(arr.reshape(-1).view(np.uint8))
+        pos = 0
+        while pos < len(buf):
+            n = os.preadv(fd, [buf[pos:]], offset + pos)
+            if not n:
+                self._ioerror('ERROR: Unexpected end of file "%s"' % self.filename)
+            pos += n
+
+    def _file_dtype(self):
+        """Get the data type as stored in the file (big-endian for XDR files)."""
+        return self.dtype.newbyteorder('>') if self.xdrflag == 1 else self.dtype
+
+    def _mmap_array(self):
+        """Map the whole data array of the file read-only."""
+        offset = self._data_offset()
+        mm = _handle_pool_get('mmap', self.filename)
+        return np.ndarray.__new__(np.ndarray, self.shape, dtype=self._file_dtype(),
+                                  buffer=mm, offset=offset)
+
+
+# magic value in ``RatHeaderRat.reserved[0]`` marking RAT-Z files
+ratz_magic = int(np.frombuffer(b'RATZ', dtype='<i4')[0])
+
+# compression codecs of RAT-Z files
+ratz_codecs = {'zlib': 1, 'zstd': 2, 'lz4': 3}
+
+
+def _ratz_compress(data, codec):
+    if codec == ratz_codecs['zstd'] and _optional_import('zstandard') is not None:
+        return _lazy_import('zstandard').ZstdCompressor(level=3).compress(data)
+    elif codec == ratz_codecs['lz4'] and _optional_import('lz4_frame') is not None:
+        return _lazy_import('lz4_frame').compress(data)
+    elif codec == ratz_codecs['zlib']:
+        return zlib.compress(data, 4)
+    RatFile._ioerror('The compression codec %i is not available!' % codec)
+
+
+def _ratz_decompress(data, codec):
+    if codec == ratz_codecs['zstd'] and _optional_import('zstandard') is not None:
+        return _lazy_import('zstandard').ZstdDecompressor().decompress(data)
+    elif codec == ratz_codecs['lz4'] and _optional_import('lz4_frame') is not None:
+        return _lazy_import('lz4_frame').decompress(data)
+    elif codec == ratz_codecs['zlib']:
+        return zlib.decompress(data)
+    RatFile._ioerror('The compression codec %i is not available!' % codec)
+
+
+class RatZFile(RatFile):
+    """Class for manipulating compressed, chunked ``RAT-Z`` files.
+
+    A ``RAT-Z`` file has the usual ``RatHeader`` (marked by ``ratz_magic`` in
+    ``Header.Rat.reserved[0]``), followed by a ``RatHeaderZ``. The data is
+    split along the first axis into chunks of ``chunk_rows`` lines, which are
+    compressed separately (zstd or lz4 if available, zlib otherwise). The
+    bytes of the samples can be shuffled before compression, which helps a lot
+    for float and complex data.
+
+    Reads decompress only the chunks overlapping the requested block. Block
+    writes recompress the affected chunks and append them to the file (the
+    space of the replaced chunks is not reused). A ``RAT-Z`` file can't be
+    memory mapped, ``mread`` returns a decompressed copy of the block.
+    """
+
+    def __init__(self, filename):
+        RatFile.__init__(self, filename)
+        self.Zheader = None
+        self.index = None
+        if self.exists and self.Header.Rat.reserved[0] == ratz_magic:
+            with open(self.filename, 'rb') as lun:
+                lun.seek(ctypes.sizeof(RatHeader))
+                self.Zheader = RatHeaderZ()
+                lun.readinto(self.Zheader)
+                if self.Zheader.magic != b'RATZ':
+                    self._ioerror('ERROR: Corrupt RAT-Z header in "%s"' % self.filename)
+                lun.seek(self.Zheader.index_offset)
+                self.index = np.fromfile(lun, dtype='<u8',
+                                         count=2 * self.Zheader.nchunks)
+                self.index = self.index.reshape(-1, 2).astype(np.int64)
+
+    def create(self, shape=None, header=None, compression=None, chunk_rows=None,
+               shuffle=True, **kwargs):
+        """Create an empty ``RAT-Z`` file (all chunks are zero).
+
+        Same as ``RatFile.create``, additionally the compression, the number of
+        lines per chunk and the shuffle filter can be given (see ``write``).
+        """
+        RatFile.create(self, shape=shape, header=header, **kwargs)
+        self._init_zheader(compression, chunk_rows, shuffle)
+        self.index = np.zeros((self.Zheader.nchunks, 2), dtype=np.int64)
+        self._write_headers()
+        return self
+
+    def write(self, arr=[], compression=None, chunk_rows=None, shuffle=True,
+              **kwargs):
+        """Write either a whole data array or a block of data into the file.
+
+        Works like ``RatFile.write``; for block writes the file should have
+        been written or created before.
+
+        :param arr: array to be stored in the file
+        :type arr: numpy.ndarray
+        :param compression: ``'zstd'``, ``'lz4'`` or ``'zlib'``; by default the
+          best available one.
+        :type compression: string
+        :param chunk_rows: number of lines per chunk; by default chunks have
+          about 1 MB.
+        :type chunk_rows: int
+        :param shuffle: shuffle the bytes of the samples before compression
+        :type shuffle: bool
+
+        **Keywords**:
+          :param block: a position, where to write an array, see
+            ``RatFile.write``
+          :type block: list
+          :param header: RAT header, whose info and geo parts are kept
+          :type header: RatHeader
+
+        :raises: IOError
+        """
+        arr = np.asarray(arr)
+        if arr.ndim == 0:
+            arr = arr.reshape(1)
+
+        if 'block' in kwargs:
+            self._check_ratz()
+            quant = self._quantization()
+            if quant is not None and arr.dtype == dtype_dict.get(quant[1]):
+                arr = quantize_array(arr, *quant)[0]
+            self._check_dtypes(arr)
+            block = self._check_block(kwargs['block'], arr=arr)
+            ind = tuple(map(
+                lambda x, y: slice(x, y, None), block[::2], block[1::2]))
+            if arr.size == 0:
+                return
+            rows = self.Zheader.chunk_rows
+            with open(self.filename, 'r+b') as lun:
+                pos = self.Zheader.index_offset
+                for k in range(block[0] // rows, (block[1] - 1) // rows + 1):
+                    chunk = self._read_chunk(lun.fileno(), k).copy()
+                    first = max(block[0], k * rows)
+                    last = min(block[1], (k + 1) * rows)
+                    chunk[(slice(first - k * rows, last - k * rows),) + ind[1:]] = \
+                        arr[first - block[0]:last - block[0]]
+                    data = self._encode(chunk)
+                    lun.seek(pos)
+                    lun.write(data)
+                    self.index[k] = (pos, len(data))
+                    pos += len(data)
+                self.Zheader.index_offset = pos
+                self._write_index(lun)
+            return
+
+        if arr.size == 0:
+            self._ioerror('Specify an array!')
+        quant = None
+        if 'quantize' in kwargs:
+            arr, quant = quantize_array(arr, kwargs['quantize'])
+        if 'header' in kwargs:
+            self.Header = RatHeader.from_buffer_copy(bytes(kwargs['header']))
+        else:
+            self.Header = RatHeader()
+        self.Header.Rat.ndim = ctypes.c_int(arr.ndim)
+        self.Header.Rat.idl_shape = (ctypes.c_int * 8)(*arr.shape[::-1])
+        self.Header.Rat.nchannel = ctypes.c_int(int(np.prod(arr.shape[2:])))
+        self.Header.Rat.var = get_var(arr.dtype.name)
+        if 'rattype' in kwargs:
+            self.Header.Rat.rattype = kwargs['rattype']
+        self.shape = self._get_shape()
+        self.dtype = self._get_dtype()
+        self.ndim = len(self.shape)
+        self._set_quantization(quant)
+        self._init_zheader(compression, chunk_rows, shuffle)
+        self.index = np.zeros((self.Zheader.nchunks, 2), dtype=np.int64)
+
+        _header_cache_drop(self.filename)
+        _handle_pool_drop(self.filename)
+        rows = self.Zheader.chunk_rows
+        with open(self.filename, 'wb') as lun:
+            lun.write(self.Header)
+            lun.write(self.Zheader)
+            pos = lun.tell()
+            for k in range(self.Zheader.nchunks):
+                data = self._encode(arr[k * rows:(k + 1) * rows])
+                lun.write(data)
+                self.index[k] = (pos, len(data))
+                pos += len(data)
+            self.Zheader.index_offset = pos
+            self._write_index(lun)
+        self.exists = True
+        self.version, self.xdrflag = 2.0, 0
+
+    def read(self, out=None, workers=1, stats=None, dequantize=True, **kwargs):
+        """Read the data from the file as a numpy array.
+
+        Only the chunks overlapping the block are decompressed, with
+        ``workers`` threads in parallel. The keywords are the same as for
+        ``RatFile.read``.
+
+        :return: numpy.ndarray
+        """
+        if self.exists == False:
+            self._ioerror('ERROR: The file "%s" does not exist'%self.filename)
+        self._check_ratz()
+        block, steps, ind = self._get_index(**kwargs)
+        shape = tuple(int(x) for x in -((block[::2] - block[1::2]) // steps))
+        out = self._prepare_out(out, shape)
+
+        t0 = time.time()
+        lines = np.arange(block[0], block[1], steps[0])
+        rows = self.Zheader.chunk_rows
+        chunks = np.unique(lines // rows)
+        bounds = np.searchsorted(lines, np.append(chunks, chunks[-1:] + 1) * rows)
+
+        def fill(n):
+            k = int(chunks[n])
+            first, last = bounds[n], bounds[n + 1]
+            chunk = self._read_chunk(fd, k)
+            sel = slice(lines[first] - k * rows, lines[last - 1] - k * rows + 1,
+                        steps[0])
+            out[first:last] = chunk[(sel,) + ind[1:]]
+
+        with _pooled_handle('fd', self.filename) as fd:
+            if workers > 1 and len(chunks) > 1:
+                with ThreadPoolExecutor(min(workers, len(chunks))) as pool:
+                    for job in [pool.submit(fill, n) for n in range(len(chunks))]:
+                        job.result()
+            else:
+                for n in range(len(chunks)):
+                    fill(n)
+        if stats is not None:
+            stats.add(out.nbytes, time.time() - t0)
+        if dequantize:
+            return self._dequantize(out)
+        return out
+
+    def mread(self, **kwargs):
+        """Read the data (no memory map possible), same as ``read`` but
+        quantized data is returned as stored."""
+        self._warn_quantized()
+        return self.read(dequantize=False, **kwargs)
+
+    def append(self, arr):
+        self._ioerror('ERROR: Appending to RAT-Z files is not supported')
+
+    def mmap_writable(self):
+        self._ioerror('ERROR: RAT-Z files can not be memory mapped')
+
+    def _check_ratz(self):
+        if self.Zheader is None:
+            self._ioerror('ERROR: "%s" is not a RAT-Z file' % self.filename)
+
+    def _init_zheader(self, compression, chunk_rows, shuffle):
+        if compression is None or compression is True:
+            compression = ('zstd' if _optional_import('zstandard') is not None else
+                           'lz4' if _optional_import('lz4_frame') is not None else 'zlib')
+        if compression not in ratz_codecs:
+            self._ioerror('Unknown compression "%s"!' % compression)
+        row_bytes = self.dtype.itemsize * int(np.prod(self.shape[1:]))
+        if chunk_rows is None:
+            chunk_rows = max(1, (1 << 20) // max(row_bytes, 1))
+        self.Header.Rat.reserved[0] = ratz_magic
+        self.Zheader = RatHeaderZ()
+        self.Zheader.magic = b'RATZ'
+        self.Zheader.version = 1
+        self.Zheader.codec = ratz_codecs[compression]
+        self.Zheader.shuffle = 1 if shuffle else 0
+        self.Zheader.chunk_rows = int(chunk_rows)
+        self.Zheader.nchunks = -(-int(self.shape[0]) // int(chunk_rows))
+        self.Zheader.index_offset = ctypes.sizeof(RatHeader) + ctypes.sizeof(RatHeaderZ)
+
+    def _write_headers(self):
+        _header_cache_drop(self.filename)
+        _handle_pool_drop(self.filename)
+        with open(self.filename, 'wb') as lun:
+            lun.write(self.Header)
+            lun.write(self.Zheader)
+            self._write_index(lun)
+
+    def _write_index(self, lun):
+        """Write the chunk index at ``index_offset`` and update ``Zheader``."""
+        lun.seek(self.Zheader.index_offset)
+        self.index.astype('<u8').tofile(lun)
+        lun.truncate()
+        lun.seek(ctypes.sizeof(RatHeader))
+        lun.write(self.Zheader)
+
+    def _shuffle_size(self):
+        if self.Zheader.shuffle == 0:
+            return 1
+        # shuffle the bytes of real and imaginary part separately
+        return self.dtype.itemsize // 2 if self.dtype.kind == 'c' else self.dtype.itemsize
+
+    def _encode(self, chunk):
+        size = self._shuffle_size()
+        data = np.ascontiguousarray(chunk, dtype=self.dtype).reshape(-1).view(np.uint8)
+        if size > 1:
+            data = data.reshape(-1, size).T
+        return _ratz_compress(data.tobytes(), self.Zheader.codec)
+
+    def _read_chunk(self, fd, k):
+        """Read and decompress chunk ``k``; chunks never written are zero."""
+        rows = self.Zheader.chunk_rows
+        shape = (min(rows, int(self.shape[0]) - k * rows),) + tuple(self.shape[1:])
+        offset, nbytes = self.index[k]
+        if nbytes == 0:
+            return np.zeros(shape, dtype=self.dtype)
+        data = _pread(fd, int(nbytes), int(offset))
+        if len(data) != nbytes:
+            self._ioerror('ERROR: Unexpected end of file "%s"' % self.filename)
+        data = np.frombuffer(_ratz_decompress(data, self.Zheader.codec), dtype=np.uint8)
+        size = self._shuffle_size()
+        if size > 1:
+            data = data.reshape(size, -1).T.reshape(-1)
+        return data.view(self.dtype).reshape(shape)
+
+    def _mmap_array(self):
+        return _RatZView(self)
+
+
+class _RatZView(object):
+    """Read-only array-like view on a ``RAT-Z`` file, decompressing on slicing.
+
+    Supports slicing by a tuple of slices, which is used by the memory map
+    based methods of ``RatFile`` (``iter_blocks``, ``read_multilooked``).
+    """
+
+    def __init__(self, rat_file):
+        self.rat_file = rat_file
+        self.shape = rat_file.shape
+        self.dtype = rat_file.dtype
+        self.ndim = len(self.shape)
+
+    def __getitem__(self, ind):
+        if not isinstance(ind, tuple):
+            ind = (ind,)
+        block, steps = [], []
+        for k, n in enumerate(self.shape):
+            sl = ind[k] if k < len(ind) else slice(None)
+            if not isinstance(sl, slice):
+                RatFile._ioerror('RAT-Z files can only be sliced!')
+            start, stop, step = sl.indices(int(n))
+            if step < 1:
+                RatFile._ioerror('RAT-Z files can only be sliced forward!')
+            block += [start, max(start, stop)]
+            steps.append(step)
+        return self.rat_file.read(block=block, decimate=steps, dequantize=False)
+
+
+class RatTileWriter(object):
+    """Write the tiles of one ``RAT`` file from several processes.
+
+    The writer which is given a ``shape`` owns the file: it writes the header
+    once, extends the file to its full size and keeps track of the written
+    tiles in a small status file (``filename + '.tiles'``). Other writers
+    (e.g. in worker processes) open the same file given only the filename and
+    share the tile grid and the status. Tiles are handed out either by index
+    or by ``claim``, which returns the next free tile. Writes of arbitrary
+    blocks, which may overlap, are protected by ``fcntl`` byte-range locks
+    (open file description locks where available, which also exclude other
+    threads). All writes go through the writer's own file descriptor.
+    On ``close`` the owner verifies that all the tiles have been written::
+
+        with RatTileWriter('out.rat', shape=(n, m), dtype='complex64',
+                           tile=(1024, 1024)) as writer:
+            pool.map(process_tile, range(len(writer)))
+
+        def process_tile(k):
+            with RatTileWriter('out.rat') as writer:
+                writer.write(compute(writer.block(k)), k)
+
+    :param filename: the ``RAT`` file
+    :type filename: string
+    :param shape: the shape of a new file; if not given, the file and its
+      status file should have been created by the owner before.
+    :type shape: list
+    :param tile: the tile size along the first axes, the remaining axes are
+      not tiled; by default the whole array is a single tile.
+    :type tile: list
+
+    **Keywords** are passed to ``RatFile.create`` (e.g. ``dtype``).
+    """
+
+    _status_offset = 64
+
+    def __init__(self, filename, shape=None, tile=None, **kwargs):
+        self.filename = filename
+        self.statusfile = filename + '.tiles'
+        self.owner = shape is not None
+        self.rat = RatFile(filename)
+        self._lock = threading.Lock()
+
+        if self.owner:
+            self.rat.create(shape=shape, **kwargs)
+            with open(self.filename, 'r+b') as lun:
+                lun.truncate(self.rat.n_bytes_total)
+            self.tile = self._check_tile(tile)
+            grid = self._make_grid()
+            with open(self.statusfile, 'wb') as lun:
+                np.asarray(self.tile + [0] * (8 - len(self.tile)),
+                           dtype=np.int64).tofile(lun)
+                lun.write(bytes(len(grid)))
+        else:
+            if self.rat.exists == False or not os.path.exists(self.statusfile):
+                RatFile._ioerror('ERROR: The file "%s" was not created by a '
+                                 'RatTileWriter' % filename)
+            saved = np.fromfile(self.statusfile, dtype=np.int64, count=8)
+            saved = [int(t) for t in saved if t > 0]
+            if tile is not None and self._check_tile(tile) != saved:
+                RatFile._ioerror('The tile size %s does not correspond to the '
+                                 'one of the file %s!' % (str(tile), str(saved)))
+            self.tile = saved
+            grid = self._make_grid()
+        self.grid = grid
+        self._fd = os.open(self.filename, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        self._status_fd = os.open(self.statusfile, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+
+    def _check_tile(self, tile):
+        shape = list(self.rat.shape)
+        if tile is None:
+            tile = shape
+        tile = [int(t) for t in np.atleast_1d(tile)]
+        if len(tile) > len(shape) or len(tile) > 8 or min(tile) < 1:
+            RatFile._ioerror('Invalid tile size %s for the shape %s!'
+                             % (str(tile), str(shape)))
+        return tile
+
+    def _make_grid(self):
+        shape = [int(n) for n in self.rat.shape]
+        sizes = self.tile + shape[len(self.tile):]
+        grid = []
+        for starts in itertools.product(*[range(0, n, t) for n, t in zip(shape, sizes)]):
+            block = []
+            for start, n, t in zip(starts, shape, sizes):
+                block += [start, min(start + t, n)]
+            grid.append(block)
+        return grid
+
+    def __len__(self):
+        return len(self.grid)
+
+    def block(self, k):
+        """Get the block ``[start_1, stop_1, ..., start_N, stop_N]`` of tile k."""
+        return list(self.grid[k])
+
+    def status(self):
+        """Get the status of all tiles: 0 free, 1 claimed, 2 written."""
+        raw = _pread(self._status_fd, len(self.grid), self._status_offset)
+        return np.frombuffer(raw, dtype=np.uint8)
+
+    def missing(self):
+        """Get the indices of the tiles which have not been written yet."""
+        return [int(k) for k in np.nonzero(self.status() != 2)[0]]
+
+    def claim(self):
+        """Claim the next free tile.
+
+        :return: ``(k, block)`` of the claimed tile, ``None`` if all tiles
+          have been handed out.
+        """
+        with self._lock:
+            self._lockf(self._status_fd, self._status_offset, len(self.grid))
+            try:
+                free = np.nonzero(self.status() == 0)[0]
+                if len(free) == 0:
+                    return None
+                k = int(free[0])
+                _pwrite(self._status_fd, b'\x01', self._status_offset + k)
+            finally:
+                self._unlockf(self._status_fd, self._status_offset, len(self.grid))
+        return k, self.block(k)
+
+    def write(self, arr, k=None, block=None):
+        """Write a tile given by its index ``k`` or an arbitrary ``block``.
+
+        Tiles are disjoint, but an arbitrary block may overlap with them and
+        with other writes, so the byte range of the lines spanned by a tile or
+        block is locked during the write. All tiles which are completely
+        covered by the written data are marked as written.
+        """
+        if (k is None) == (block is None):
+            RatFile._ioerror('Specify either a tile index or a block!')
+        arr = np.asarray(arr)
+        if arr.ndim == 0:
+            arr = arr.reshape(1)
+        arr, block = self.rat._block_data(arr, self.grid[k] if k is not None else block)
+        block = [int(b) for b in block]
+        row_bytes = self.rat.dtype.itemsize * int(np.prod(self.rat.shape[1:]))
+        start = self.rat._data_offset() + block[0] * row_bytes
+        length = (block[1] - block[0]) * row_bytes
+        with self._lock:
+            self._lockf(self._fd, start, length)
+            try:
+                self.rat._pwrite_block(self._fd, arr, block)
+            finally:
+                self._unlockf(self._fd, start, length)
+        if k is not None:
+            written = [k]
+        else:
+            written = [n for n, tile in enumerate(self.grid)
+                       if all(a >= b for a, b in zip(tile[::2], block[::2])) and
+                       all(a <= b for a, b in zip(tile[1::2], block[1::2]))]
+        for n in written:
+            _pwrite(self._status_fd, b'\x02', self._status_offset + n)
+
+    @staticmethod
+    def _lockf(fd, start, length, unlock=False):
+        if fcntl is None or length <= 0:
+            return
+        if hasattr(fcntl, 'F_OFD_SETLKW') and struct.calcsize('l') == 8:
+            # open file description lock (Linux): not dropped when another
+            # descriptor of the file is closed and exclusive between threads
+            ltype = fcntl.F_UNLCK if unlock else fcntl.F_WRLCK
+            fcntl.fcntl(fd, fcntl.F_OFD_SETLKW,
+                        struct.pack('hhqqi4x', ltype, os.SEEK_SET, start, length, 0))
+        else:
+            fcntl.lockf(fd, fcntl.LOCK_UN if unlock else fcntl.LOCK_EX,
+                        length, start, os.SEEK_SET)
+
+    @staticmethod
+    def _unlockf(fd, start, length):
+        RatTileWriter._lockf(fd, start, length, unlock=True)
+
+    def close(self, verify=True):
+        """Close the writer; the owner verifies that all tiles were written.
+
+        If the file is complete, the status file is removed. Otherwise it is
+        kept (so the missing tiles can be written later) and an IOError is
+        raised.
+        """
+        if self._fd is None:
+            return
+        missing = self.missing() if self.owner else []
+        os.close(self._fd)
+        os.close(self._status_fd)
+        self._fd = self._status_fd = None
+        if self.owner and verify:
+            if len(missing) > 0:
+                RatFile._ioerror('ERROR: %i of %i tiles of "%s" have not been '
+                                 'written!' % (len(missing), len(self.grid),
+                                               self.filename))
+            os.remove(self.statusfile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # don't hide an exception by the completeness check
+        self.close(verify=exc_type is None)
+
+
+class ReadStats(object):
+    """Collects the throughput of ``RatFile.read`` calls.
+
+    Pass an instance as ``stats`` keyword to ``RatFile.read`` or ``rrat``; the
+    number of bytes and the elapsed time are accumulated over all calls.
+    ``RatFile.prefetching_blocks`` additionally accumulates the time the
+    caller had to wait for the data in ``wait``.
+    """
+
+    def __init__(self):
+        self.nbytes = 0
+        self.seconds = 0.0
+        self.wait = 0.0
+
+    def add(self, nbytes, seconds):
+        self.nbytes += int(nbytes)
+        self.seconds += seconds
+
+    @property
+    def gbps(self):
+        """Achieved read rate in GB/s."""
+        if self.seconds <= 0:
+            return 0.0
+        return self.nbytes / self.seconds / 1e9
+
+    @property
+    def hidden(self):
+        """Reading time hidden behind the computation by prefetching."""
+        return max(self.seconds - self.wait, 0.0)
+
+    def __repr__(self):
+        return 'ReadStats(%i bytes in %.3f s, %.3f GB/s, %.3f s waited)' % (
+            self.nbytes, self.seconds, self.gbps, self.wait)
+
+
+# process-wide cache of parsed RAT headers: abspath -> ((mtime, size), header)
+header_cache_size = 4096
+_header_cache = OrderedDict()
+_header_cache_lock = threading.Lock()
+
+
+def _header_cache_get(key, stamp):
+    with _header_cache_lock:
+        entry = _header_cache.get(key)
+        if entry is None or entry[0] != stamp:
+            return None
+        _header_cache.move_to_end(key)
+        return entry[1]
+
+
+def _header_cache_put(key, stamp, value):
+    with _header_cache_lock:
+        _header_cache[key] = (stamp, value)
+        _header_cache.move_to_end(key)
+        while len(_header_cache) > header_cache_size:
+            _header_cache.popitem(last=False)
+
+
+def _header_cache_drop(filename):
+    with _header_cache_lock:
+        _header_cache.pop(os.path.abspath(filename), None)
+
+
+# pool of open file handles (read-only file descriptors, read-only maps and h5py files), shared by
+# all RatFile and HDFarray instances; when it is full, the least recently used handles which are not
+# in use are closed. h5py files are closed as soon as no HDFarray uses them any more, as an open
+# HDF5 file is locked for other processes.
+handle_pool_size = 64
+_handle_pool = OrderedDict()
+_handle_pool_lock = threading.Lock()
+
+
+class _PooledHandle(object):
+    """An open handle of the pool, closed when it is evicted and no longer in use."""
+
+    def __init__(self, key, handle, stamp, mode):
+        self.key = key
+        self.handle = handle
+        self.stamp = stamp
+        self.mode = mode
+        self.users = 0
+        self.evicted = False
+
+    def close(self):
+        if isinstance(self.handle, int):
+            os.close(self.handle)
+        elif not isinstance(self.handle, mmap.mmap):
+            self.handle.close()
+        # maps are not closed: arrays returned by mread may still point into them, a map is
+        # unmapped when the last of them is deleted
+
+
+def _handle_stamp(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _handle_open(kind, filename, mode):
+    if kind == 'fd':
+        return os.open(filename, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    if kind == 'mmap':
+        with open(filename, 'rb') as lun:
+            return mmap.mmap(lun.fileno(), length=0, access=mmap.ACCESS_READ)
+    return _lazy_import('h5py').File(filename, mode)
+
+
+def _handle_evict(entry):
+    entry.evicted = True
+    if entry.users == 0:
+        entry.close()
+
+
+def _handle_reopen(entry, filename, mode):
+    """Reopen a used h5py file of the pool in place."""
+    entry.handle.close()
+    try:
+        entry.handle = _handle_open('h5', filename, mode)
+    except Exception:
+        _handle_evict(_handle_pool.pop(entry.key))
+        raise
+    entry.mode = mode
+    entry.stamp = _handle_stamp(filename)
+
+
+def _handle_pool_acquire(kind, filename, mode='r'):
+    """Get a pooled handle ('fd', 'mmap' or 'h5') of a file and mark it as used; release it with
+    _handle_pool_release. Handles are reopened when the file has been changed or replaced (an h5py
+    file opened in 'a' mode only when replaced) and an 'h5' handle opened in 'r' mode is reopened
+    in 'a' mode if asked for. A used 'h5' handle is reopened in place, its users get the new
+    handle by the handle attribute of the entry."""
+    key = (kind, os.path.abspath(filename))
+    stamp = _handle_stamp(filename)
+    with _handle_pool_lock:
+        entry = _handle_pool.get(key)
+        if entry is not None:
+            if entry.mode == 'a':
+                valid = stamp is not None and entry.stamp[:2] == stamp[:2]
+            else:
+                valid = entry.stamp == stamp and mode == 'r'
+            if not valid and kind == 'h5' and entry.users > 0:
+                # h5py can't open a file twice in one process, so the users share the handle
+                # and it is reopened in place (in 'a' mode if any of them writes)
+                _handle_reopen(entry, filename, 'a' if 'a' in (entry.mode, mode) else 'r')
+            elif not valid:
+                _handle_evict(_handle_pool.pop(key))
+                entry = None
+        if entry is None:
+            handle = _handle_open(kind, filename, mode)
+            entry = _PooledHandle(key, handle, _handle_stamp(filename), mode)
+            _handle_pool[key] = entry
+        entry.users += 1
+        _handle_pool.move_to_end(key)
+        unused = [k for k, e in _handle_pool.items() if e.users == 0]
+        for k in unused[:max(len(_handle_pool) - max(handle_pool_size, 1), 0)]:
+            _handle_evict(_handle_pool.pop(k))
+    return entry
+
+
+def _handle_pool_release(entry):
+    with _handle_pool_lock:
+        entry.users -= 1
+        if entry.users > 0:
+            return
+        if entry.evicted:
+            entry.close()
+        elif entry.key[0] == 'h5' and _handle_pool.get(entry.key) is entry:
+            # don't keep HDF5 files open (and locked) which are not used
+            _handle_evict(_handle_pool.pop(entry.key))
+
+
+@contextlib.contextmanager
+def _pooled_handle(kind, filename, mode='r'):
+    entry = _handle_pool_acquire(kind, filename, mode)
+    try:
+        yield entry.handle
+    finally:
+        _handle_pool_release(entry)
+
+
+def _handle_pool_get(kind, filename, mode='r'):
+    """Get a pooled handle without keeping it marked as used (for maps, which are never closed)."""
+    with _pooled_handle(kind, filename, mode) as handle:
+        return handle
+
+
+def _handle_pool_drop(filename):
+    """Close all pooled handles of a file, e.g. before it is rewritten."""
+    path = os.path.abspath(filename)
+    with _handle_pool_lock:
+        for key in [key for key in _handle_pool if key[1] == path]:
+            _handle_evict(_handle_pool.pop(key))
+
+
+def close_handles():
+    """Close all pooled file handles (handles in use are closed when they are released)."""
+    with _handle_pool_lock:
+        while _handle_pool:
+            _handle_evict(_handle_pool.popitem()[1])
+
+
+def scan_rat_dir(path, pattern='*.rat', recursive=True):
+    """Collect shape, dtype and info of all RAT files in a directory tree.
+
+    Only the headers are read (one open per file, cached process-wide), so
+    scanning big campaign directories is fast.
+
+    :param path: directory to scan
+    :type path: string
+    :param pattern: shell pattern of the file names
+    :type pattern: string
+    :param recursive: scan sub-directories, too
+    :type recursive: bool
+
+    :return: dictionary ``{filename: {'shape', 'dtype', 'data_dtype', 'info',
+      'version'}}``, where ``dtype`` is the stored and ``data_dtype`` the
+      dequantized type (see ``RatFile.data_dtype``); files which are not valid
+      RAT files are skipped.
+    """
+    result = OrderedDict()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(fnmatch.filter(files, pattern)):
+            filename = os.path.join(root, name)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                rat_file = RatFile(filename)
+            if rat_file.exists:
+                result[filename] = {'shape': rat_file.shape,
+                                    'dtype': rat_file.dtype,
+                                    'data_dtype': rat_file.data_dtype,
+                                    'info': rat_file.info,
+                                    'version': float(rat_file.version)}
+        if not recursive:
+            break
+    return result
+
+
+def sar_chunks(shape, dtype=None, tile=256):
+    """Get SAR-friendly chunks for an array: square tiles of ``tile`` samples
+    along the two largest axes, the other axes (e.g. channels) are not split.
+    """
+    shape = tuple(int(n) for n in shape)
+    if len(shape) == 0 or min(shape) == 0:
+        return None
+    if len(shape) == 1:
+        return (min(shape[0], tile * tile),)
+    largest = sorted(range(len(shape)), key=lambda k: shape[k])[-2:]
+    return tuple(min(n, tile) if k in largest else n for k, n in enumerate(shape))
+
+
+def rat2chunked(src, dst, chunks=None, workers=4, compression='gzip', fmt=None):
+    """Convert a RAT file into a chunked HDF5 or Zarr file.
+
+    The RAT file is read in bands of ``chunks[0]`` lines by ``workers``
+    threads and the bands are written in order, so at most ``workers`` bands
+    are kept in memory. HDF5 output is a STE-HDF5 file (dataset ``D1``, which
+    can be read with ``rarr``), written by the calling thread. Zarr arrays are
+    written by the workers in parallel. After each band the number of
+    converted lines is stored in the attribute ``rat2chunked_rows``, so an
+    interrupted conversion continues when called again.
+
+    :param src: RAT (or RAT-Z) file
+    :type src: string
+    :param dst: output file; a Zarr array is written if it ends with ``.zarr``
+    :type dst: string
+    :param chunks: chunk shape, by default ``sar_chunks``
+    :type chunks: list
+    :param workers: number of threads
+    :type workers: int
+    :param compression: compression of the HDF5 dataset (Zarr uses its
+      default compressor)
+    :type compression: string
+    :param fmt: ``'hdf5'`` or ``'zarr'``, by default given by ``dst``
+    :type fmt: string
+
+    :return: name of the written file
+    """
+    rat = open_rat(src)
+    if rat.exists == False:
+        RatFile._ioerror('ERROR: The file "%s" does not exist' % src)
+    dtype = rat.data_dtype
+    shape = tuple(int(n) for n in rat.shape)
+    if chunks is None or min(shape, default=0) == 0:
+        chunks = sar_chunks(shape, dtype)
+    else:
+        # chunks may not be larger than the data
+        chunks = tuple(min(int(c), n) for c, n in zip(chunks, shape)) + shape[len(chunks):]
+    if fmt is None:
+        fmt = 'zarr' if dst.rstrip('/').endswith('.zarr') else 'hdf5'
+
+    hdfobj = None
+    try:
+        if fmt == 'zarr':
+            try:
+                import zarr
+            except ImportError:
+                RatFile._ioerror('Writing Zarr arrays needs the "zarr" module!')
+            dset = None
+            if os.path.exists(dst):
+                dset = zarr.open_array(dst, mode='a')
+                if dset.shape != shape or dset.dtype != dtype:
+                    dset = None
+            if dset is None:
+                dset = zarr.open_array(dst, mode='w', shape=shape, dtype=dtype,
+                                       chunks=chunks)
+                dset.attrs['annotation'] = rat.info
+        elif fmt == 'hdf5':
+            hdfobj = HDFarray(dst)
+            dst = hdfobj.filename
+            lun = hdfobj._writable()
+            dset = lun.get('D1')
+            if dset is None or dset.shape != shape or dset.dtype != dtype:
+                for ds in list(lun):
+                    del lun[ds]
+                dset = lun.create_dataset('D1', shape=shape, dtype=dtype,
+                                          chunks=chunks, compression=compression)
+                hdfobj.annotate(rat.info)
+        else:
+            RatFile._ioerror('Unknown format "%s"!' % fmt)
+
+        rows = chunks[0] if chunks is not None else max(shape[0], 1)
+        done = int(dset.attrs.get('rat2chunked_rows', 0))
+        starts = iter(range(done, shape[0], rows))
+
+        def convert(start):
+            stop = min(start + rows, shape[0])
+            band = rat.read(block=[start, stop] + [x for n in shape[1:] for x in (0, n)])
+            if fmt == 'zarr':
+                dset[start:stop] = band
+                return stop, None
+            return stop, band
+
+        with ThreadPoolExecutor(max(workers, 1)) as pool:
+            pending = deque(pool.submit(convert, start)
+                            for start in itertools.islice(starts, max(workers, 1)))
+            while pending:
+                stop, band = pending.popleft().result()
+                if band is not None:
+                    dset[stop - len(band):stop] = band
+                dset.attrs['rat2chunked_rows'] = stop
+                pending.extend(pool.submit(convert, start)
+                               for start in itertools.islice(starts, 1))
+    finally:
+        if hdfobj is not None:
+            hdfobj.close()
+    return dst
+
+
+def rat2chunked_main(argv=None):
+    """Command line interface of ``rat2chunked`` for converting whole campaigns::
+
+        python ste_io.py [-c ROWS COLS] [-w WORKERS] [-f hdf5|zarr] SRC [SRC ...] DST
+
+    Each ``SRC`` is a RAT file or a directory, which is scanned recursively;
+    the directory structure is mirrored in the output directory ``DST``.
+    Files which fail to convert are reported and skipped.
+
+    :return: list of the files which failed to convert
+    """
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Convert RAT files into chunked HDF5 or Zarr files.')
+    parser.add_argument('src', nargs='+', help='RAT files or directories')
+    parser.add_argument('dst', help='output directory')
+    parser.add_argument('-c', '--chunks', type=int, nargs=2, metavar=('ROWS', 'COLS'),
+                        help='chunk shape (default: 256x256 tiles)')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='number of threads (default: 4)')
+    parser.add_argument('-f', '--format', choices=('hdf5', 'zarr'), default='hdf5')
+    parser.add_argument('--compression', default='gzip',
+                        help='HDF5 compression, "none" for no compression')
+    parser.add_argument('--pattern', default='*.rat',
+                        help='file name pattern in directories (default: *.rat)')
+    args = parser.parse_args(argv)
+
+    compression = None if args.compression == 'none' else args.compression
+    extension = '.zarr' if args.format == 'zarr' else '.hd5'
+    failed = []
+    for src in args.src:
+        if os.path.isdir(src):
+            files = [(f, os.path.relpath(f, src)) for f in scan_rat_dir(src, args.pattern)]
+        else:
+            files = [(src, os.path.basename(src))]
+        for filename, name in files:
+            name = os.path.join(args.dst, os.path.splitext(name)[0] + extension)
+            if not os.path.isdir(os.path.dirname(name)):
+                os.makedirs(os.path.dirname(name))
+            print(filename + ' -> ' + name)
+            try:
+                rat2chunked(filename, name, chunks=args.chunks, workers=args.workers,
+                            compression=compression, fmt=args.format)
+            except Exception as error:
+                print(red + 'ERROR: Failed to convert "%s": %s' % (filename, error) + endc)
+                failed.append(filename)
+    if failed:
+        print(red + '%d file(s) failed to convert.' % len(failed) + endc)
+    return failed
+
+
+def check_block(block, shape, arr=None):
+    """Check a block ``[start_1, stop_1, ..., start_N, stop_N]`` against the
+    shape of an array; a 2D block for a >2D array is expanded to the two
+    largest axes. If ``arr`` is given, the block should also correspond to its
+    shape."""
+    if len(block) == 4:                        # only 2D block provided
+        block = list(block)
+        dimlist = list(shape)
+        dimlist[dimlist.index(max(dimlist))] = 0
+        dimlist[dimlist.index(max(dimlist))] = 0
+        for k, dim in enumerate(dimlist):
+            if dim != 0:
+                block.insert(k*2, dim)
+                block.insert(k*2, 0)
+
+    stop_more_than_shape = map(lambda x, y: (x > y), block[1::2], shape)
+    if any(stop_more_than_shape):
+        RatFile._ioerror('Value of block exceeds the array shape!')
+
+    block = np.asarray(block)
+    if block.dtype.kind not in ('i','u'):
+        RatFile._ioerror('Block extent must be given by integers!')
+
+    if np.min(block) < 0:
+        RatFile._ioerror('The items in block must be nonnegative!')
+
+    if arr is not None:
+        if len(block) // 2 != arr.ndim:
+            RatFile._ioerror('The dimensions of block do not correspond to the '
+                             'dimensions of array!')
+
+        block_not_shape = map(lambda x, y, z: (x - y) != z,
+                              block[1::2], block[::2],
+                              arr.shape)
+        if any(block_not_shape):
+            RatFile._ioerror('Length of block components %s does not correspond to'
+                             ' the shape of the array %s!'%(str(block),str(arr.shape)))
+    return block
+
 
 def check_ratformat(filename):
     with open(filename, 'rb') as lun:
@@ -1026,6 +2819,80 @@ def get_var(dtype):
     else:
         return ctypes.c_int(var[0])
 
+# reduced precision storage modes, see RatFile.write; the mode, original
+# ``var``, scale and offset are stored in ``RatHeaderRat.reserved[1:5]``
+quantize_modes = {'float16': 1, 'int16-log': 2, 'phase-uint16': 3}
+
+# magic value in ``RatHeaderRat.reserved[5]`` marking quantized files
+quantize_magic = int(np.frombuffer(b'RATQ', dtype='<i4')[0])
+
+
+def quantize_array(arr, mode, var=None, scale=None, offset=None):
+    """Quantize an array for storing it with reduced precision.
+
+    ``'float16'`` stores half precision floats (complex samples as a pair in
+    an uint32, as RAT has no float16 type), ``'int16-log'`` stores positive
+    values logarithmically in int16 (non-positive values become 0) and
+    ``'phase-uint16'`` stores phases in radians as uint16.
+
+    :param arr: array to quantize
+    :param mode: one of ``quantize_modes``
+    :param var: original data type (given by ``arr`` if not specified)
+    :param scale: stored value to data scaling, computed if not given
+    :param offset: stored value to data offset, computed if not given
+
+    :return: ``(stored_array, (mode, var, scale, offset))``
+    """
+    if mode not in quantize_modes:
+        RatFile._ioerror('Unknown quantization mode "%s"!' % mode)
+    arr = np.asarray(arr)
+    if var is None:
+        var = get_var(arr.dtype).value
+    if mode != 'float16' and arr.dtype.kind == 'c':
+        RatFile._ioerror('Quantization mode "%s" needs real data!' % mode)
+
+    if mode == 'float16':
+        scale, offset = 1.0, 0.0
+        if arr.dtype.kind == 'c':
+            pairs = np.ascontiguousarray(arr, dtype=np.complex64).view(np.float32)
+            stored = pairs.astype(np.float16).view(np.uint32)
+        else:
+            stored = arr.astype(np.float16).view(np.uint16)
+    elif mode == 'int16-log':
+        valid = arr > 0
+        db = np.zeros(arr.shape, dtype=np.float64)
+        db[valid] = 10 * np.log10(arr[valid])
+        if scale is None:
+            if valid.any():
+                lo, hi = db[valid].min(), db[valid].max()
+            else:
+                lo, hi = 0.0, 0.0
+            scale = (hi - lo) / 65534 if hi > lo else 1.0
+            offset = lo + 32767 * scale
+        stored = np.clip(np.round((db - offset) / scale), -32767, 32767).astype(np.int16)
+        stored[~valid] = -32768
+    else:
+        scale, offset = 2 * np.pi / 65536, -np.pi
+        stored = (np.round((arr + np.pi) / scale).astype(np.int64) % 65536).astype(np.uint16)
+    return stored, (mode, var, float(scale), float(offset))
+
+
+def dequantize_array(stored, mode, var, scale, offset):
+    """Restore data stored by ``quantize_array``."""
+    dtype = np.dtype(dtype_dict[var])
+    if mode == 'float16':
+        if dtype.kind == 'c':
+            pairs = np.ascontiguousarray(stored).view(np.float16)
+            return pairs.astype(np.float32).view(np.complex64).astype(dtype, copy=False)
+        return stored.view(np.float16).astype(dtype)
+    elif mode == 'int16-log':
+        arr = (10 ** ((stored * scale + offset) / 10)).astype(dtype)
+        arr[stored == -32768] = 0
+        return arr
+    else:
+        return (stored * scale + offset).astype(dtype)
+
+
 # data type dictionary to net RAT's and np's data formats
 dtype_dict = {1: 'uint8',
               2: 'int16',
@@ -1068,11 +2935,25 @@ class Py2Xml(object):
     pp.v0 = 100
     pp.write('path_to_new_pp.xml')
 
+    Numeric arrays with at least base64_threshold elements are written base64 encoded (binary
+    little-endian values, marked by encoding="base64" in the value element), e.g.
+
+    Py2Xml.base64_threshold = 10000
+
+    By default (None) all values are written as text. Only base64 values are fast for large
+    arrays: text values are formatted element by element (about 1 s per million floats) and
+    parsed by numpy's text parser.
     """
 
+    base64_threshold = None
+
+    # numeric datatypes: dtype of base64 encoded values and of decoded arrays
+    base64_dtypes = {'int': '<i4', 'long': '<i8', 'float': '<f4', 'double': '<f8'}
+    array_dtypes = {'int': np.int64, 'long': np.int64, 'float': np.float64, 'double': np.float64}
+
     def __init__(self, root):
         if isinstance(root, str):
-            self.__dict__['__root__'] = ET.parse(root).find('object')
+            self.__dict__['__root__'] = _lazy_import('ET').parse(root).find('object')
         else:
             self.__dict__['__root__'] = root
 
@@ -1080,20 +2961,35 @@ class Py2Xml(object):
             raise ValueError('Expected an "object" element below the root element!')
 
         self.__dict__['__iterend__'] = False
+        self.__reset__()
 
+    def __reset__(self):
+        # name -> parameter elements (built on first access) and name -> decoded value
+        self.__dict__['__pindex__'] = None
+        self.__dict__['__pcache__'] = {}
 
     def __getstate__(self):
-        return ET.tostring(self.__root__, encoding=str)
+        return _lazy_import('ET').tostring(self.__root__, encoding=str)
 
     def __setstate__(self, root):
-        self.__dict__['__root__'] = ET.fromstring(root)
+        self.__dict__['__root__'] = _lazy_import('ET').fromstring(root)
         self.__dict__['__iterend__'] = False
+        self.__reset__()
 
     def copy(self):
-        return Py2Xml(copy.deepcopy(self.__dict__['__root__']))
+        return Py2Xml(copy.deepcopy(self.__root__))
+
+    def __paramindex__(self):
+        index = self.__dict__['__pindex__']
+        if index is None:
+            index = OrderedDict()
+            for p in self.__root__.iterchildren('parameter'):
+                index.setdefault(p.attrib['name'], []).append(p)
+            self.__dict__['__pindex__'] = index
+        return index
 
     def __getparam__(self, name):
-        p = [p for p in self.__root__.iterchildren('parameter') if p.attrib['name'] == name]
+        p = self.__paramindex__().get(name, [])
         if len(p) != 1:
             raise AttributeError('Expected a unique match parameter name "%s", got %i matches.' % (name, len(p)))
 
@@ -1101,7 +2997,9 @@ class Py2Xml(object):
 
 
     def params(self):
-        return [p.attrib['name'] for p in self.__root__.iterchildren('parameter')]
+        if '__root__' not in self.__dict__:
+            return list(self.__dict__['__pnames__'])
+        return [name for name, p in self.__paramindex__().items() for _ in p]
 
     @staticmethod
     def xml2val(v, t):
@@ -1118,7 +3016,23 @@ class Py2Xml(object):
             obj_arr = [Py2Xml(obj) for obj in v.iterchildren('object')]
             return obj_arr[0] if size <= 1 else obj_arr
 
-        conv = {'int': int, 'long': int, 'float': np.float, 'double': np.double, 'string': lambda s: s}
+        if v.attrib.get('encoding') == 'base64' and type in Py2Xml.base64_dtypes:
+            val = np.frombuffer(base64.b64decode(v.text), dtype=Py2Xml.base64_dtypes[type])
+            return val.astype(Py2Xml.array_dtypes[type]).reshape(shape)
+
+        if size > 1 and type in Py2Xml.array_dtypes:
+            with warnings.catch_warnings():
+                # malformed text is truncated with a DeprecationWarning (a ValueError in future
+                # numpy versions), the size check falls back to the conversion below then
+                warnings.simplefilter('ignore', DeprecationWarning)
+                try:
+                    val = np.fromstring(v.text.strip('[]'), dtype=Py2Xml.array_dtypes[type], sep=',')
+                except ValueError:
+                    val = None
+            if val is not None and val.size == size:
+                return val.reshape(shape)
+
+        conv = {'int': int, 'long': int, 'float': float, 'double': np.double, 'string': lambda s: s}
         try:
             if size > 1:
                 val = np.asarray([conv[type](v) for v in v.text.strip('[]').split(',')]).reshape(shape)
@@ -1164,6 +3078,21 @@ class Py2Xml(object):
             t.text = 'struct'
             for obj in value:
                 v.append(copy.deepcopy(obj.__root__))
+        elif isinstance(value, np.ndarray) and value.dtype.kind in 'iuf':
+            t.attrib['length'] = ' '.join([str(l) for l in value.shape[::-1]])
+            if value.dtype.kind == 'f':
+                t.text = 'float' if value.dtype.itemsize <= 4 else 'double'
+            else:
+                t.text = 'long'
+            threshold = Py2Xml.base64_threshold
+            if threshold is not None and value.size >= threshold:
+                data = np.ascontiguousarray(value, dtype=Py2Xml.base64_dtypes[t.text])
+                v.attrib['encoding'] = 'base64'
+                v.text = base64.b64encode(data.tobytes()).decode('ascii')
+            else:
+                # numpy scalars keep the shortest repr of float32 values, ints are faster as list
+                values = value.flat if value.dtype.kind == 'f' else value.ravel().tolist()
+                v.text = '[' + ', '.join(map(str, values)) + ']'
         else:
             if isinstance(value, np.ndarray):
                 t.attrib['length'] = ' '.join([str(l) for l in value.shape[::-1]])
@@ -1175,10 +3104,24 @@ class Py2Xml(object):
     def __getattr__(self, key):
         if key in self.__dict__:
             return self.__dict__[key]
+        if key == '__root__' and '__loader__' in self.__dict__:
+            # restored from a cache file: parse the XML file only now
+            loader, k = self.__dict__['__loader__']
+            self.__dict__['__root__'] = loader.load()[k]
+            return self.__dict__['__root__']
         if key == 0:
             return self
-        r, t, v = self.__getparam__(key)
-        return Py2Xml.xml2val(v, t)
+        cache = self.__dict__['__pcache__']
+        if key not in cache:
+            r, t, v = self.__getparam__(key)
+            cache[key] = Py2Xml.xml2val(v, t)
+        val = cache[key]
+        # return copies of mutable values, changing them must not change the cached value
+        if isinstance(val, np.ndarray):
+            return val.copy()
+        if isinstance(val, list):
+            return list(val)
+        return val
 
     def __getitem__(self, key):
         return self.__getattr__(key)
@@ -1188,12 +3131,15 @@ class Py2Xml(object):
             self.__dict__[name] = value
             return
         r, t, v = self.__getparam__(name)
+        self.__dict__['__pcache__'].pop(name, None)
         Py2Xml.val2xml(v, t, value)
 
     def __setitem__(self, key, value):
         self.__setattr__(key, value)
 
     def __contains__(self, key):
+        if key in self.__dict__['__pcache__']:
+            return True
         try:
             _ = self.__getparam__(key)
         except AttributeError:
@@ -1229,8 +3175,10 @@ class Py2Xml(object):
                 self.__setattr__(k, d[k])
             except AttributeError:
                 pass
+        self.__reset__()
 
     def __totree(self):
+        ET = _lazy_import('ET')
         ste_root = ET.Element('stexml')
         ste_root.text = '\n'
         ste_root.append(copy.deepcopy(self.__root__))
@@ -1242,16 +3190,120 @@ class Py2Xml(object):
         self.__totree().write(filename, pretty_print=True, encoding='UTF-8', xml_declaration=True)
 
     def tostring(self):
-        return ET.tostring(self.__totree().getroot(), encoding='UTF-8')
+        return _lazy_import('ET').tostring(self.__totree().getroot(), encoding='UTF-8')
 
     @staticmethod
     def fromstring(string):
-        return Xml2Py(ET.fromstring(string).find('object'))
+        return Xml2Py(_lazy_import('ET').fromstring(string).find('object'))
+
+    @staticmethod
+    def fromfile(filename, cache=False):
+        """
+        Returns a list with all objects of a file. With cache=True the decoded parameter values are
+        stored in a sidecar file (filename + '.cache', a pickle, so use it only for trusted files)
+        and read from there as long as the XML file is unchanged (same size and modification
+        time). The XML file is then only parsed when needed, e.g. for struct parameters, changes
+        or writing.
+        """
+        if cache:
+            objects = _py2xml_cache_load(filename)
+            if objects is not None:
+                return objects
+        root = _lazy_import('ET').parse(filename)
+        objects = [Py2Xml(o) for o in root.getroot().iterchildren('object')]
+        if cache:
+            _py2xml_cache_save(filename, objects)
+        return objects
 
     @staticmethod
-    def fromfile(filename):
-        root = ET.parse(filename)
-        return [Py2Xml(o) for o in root.getroot().iterchildren('object')]
+    def iterfile(filename, names=None):
+        """
+        Yields the objects of a file one by one while parsing it (lxml iterparse), optionally only
+        the ones with the given name(s). Parsed objects are removed from the document, so large
+        files are read with little memory.
+        """
+        if isinstance(names, str):
+            names = [names]
+        depth = 0
+        for event, elem in _lazy_import('ET').iterparse(filename, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1 or elem.tag != 'object':
+                continue
+            # detach the object and whatever precedes it (the parser may be ahead already)
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+            parent.remove(elem)
+            if names is None or elem.attrib.get('name') in names:
+                yield Py2Xml(elem)
+            else:
+                elem.clear()
+
+def _py2xml_cache_stamp(filename):
+    st = os.stat(filename)
+    return (st.st_size, st.st_mtime_ns)
+
+
+class _Py2XmlLoader(object):
+    """Parses a file once for all Py2Xml objects restored from its cache file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.roots = None
+
+    def load(self):
+        if self.roots is None:
+            self.roots = list(_lazy_import('ET').parse(self.filename).getroot().iterchildren('object'))
+        return self.roots
+
+
+def _py2xml_cache_load(filename):
+    try:
+        with open(filename + '.cache', 'rb') as lun:
+            cached = pickle.load(lun)
+        if cached['stamp'] != _py2xml_cache_stamp(filename):
+            return None
+    except Exception:                           # missing, outdated or broken cache file
+        return None
+    loader = _Py2XmlLoader(filename)
+    objects = []
+    for k, (names, values) in enumerate(cached['objects']):
+        obj = Py2Xml.__new__(Py2Xml)
+        obj.__dict__.update({'__iterend__': False, '__pindex__': None, '__pcache__': values,
+                             '__pnames__': names, '__loader__': (loader, k)})
+        objects.append(obj)
+    return objects
+
+
+def _py2xml_cache_save(filename, objects):
+    cached = {'stamp': _py2xml_cache_stamp(filename), 'objects': []}
+    for obj in objects:
+        names = obj.params()
+        values = {}
+        for name in set(names):
+            try:
+                val = obj[name]
+            except AttributeError:              # not unique
+                continue
+            # structs stay views on the XML tree, they are not cached
+            if not isinstance(val, (Py2Xml, list)):
+                values[name] = val
+        cached['objects'].append((names, values))
+    tmpname = filename + '.cache.%d' % os.getpid()
+    try:
+        with open(tmpname, 'wb') as lun:
+            pickle.dump(cached, lun, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, filename + '.cache')
+    except (IOError, OSError):
+        warnings.warn('Failed to write the cache file of "%s".' % filename)
+
 
 # for backwards-compatiblity (the old Xml2Py class is now obsolete!)
-Xml2Py = Py2Xml
\ No newline at end of file
+Xml2Py = Py2Xml
+
+
+if __name__ == '__main__':
+    raise SystemExit(1 if rat2chunked_main() else 0)
@@ -0,0 +1,73 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import ste_io
+
+pytest.importorskip('h5py')
+
+
+def _can_open_for_writing(filename):
+    code = 'import h5py; h5py.File(%r, "a").close()' % filename
+    return subprocess.run([sys.executable, '-c', code], capture_output=True).returncode == 0
+
+
+def test_file_released_with_instance(tmp_path):
+    filename = str(tmp_path / 'data.hd5')
+    ste_io.sarr(filename, np.arange(12.).reshape(3, 4))
+    hdf = ste_io.HDFarray(filename)
+    hdf.read()
+    assert not _can_open_for_writing(filename)
+    del hdf
+    assert _can_open_for_writing(filename)
+
+
+def test_exposed_datasets_survive_writes(tmp_path):
+    filename = str(tmp_path / 'data.hd5')
+    arr = np.arange(12.).reshape(3, 4)
+    ste_io.sarr(filename, [arr, arr])
+    with ste_io.HDFarray(filename) as hdf:
+        datasets = hdf.expose()
+        hdf.annotate('test')
+        hdf.write(np.zeros((1, 2)), block=[0, 1, 0, 2])
+        assert datasets[0][0, 1] == 0 and datasets[1][0, 1] == 1
+    assert _can_open_for_writing(filename)
+
+
+def test_read_parallel(tmp_path):
+    filename = str(tmp_path / 'data.hd5')
+    arr = np.arange(60 * 50, dtype=np.float32).reshape(60, 50)
+    ste_io.sarr(filename, arr)
+    with ste_io.HDFarray(filename) as hdf:
+        np.testing.assert_array_equal(hdf.read_parallel((16, 16), workers=3), arr)
+        out = hdf.read_parallel([[0, 10, 0, 10], [20, 35, 5, 50]], workers=2)
+    expected = np.zeros_like(arr)
+    expected[:10, :10] = arr[:10, :10]
+    expected[20:35, 5:] = arr[20:35, 5:]
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_write_while_read_by_another_instance(tmp_path):
+    filename = str(tmp_path / 'data.hd5')
+    arr = np.arange(12.).reshape(3, 4)
+    ste_io.sarr(filename, arr)
+    hdf = ste_io.HDFarray(filename)
+    np.testing.assert_array_equal(hdf.read(), arr)
+    ste_io.sarr(filename, 2 * arr)
+    ste_io.aarr(filename, arr)
+    np.testing.assert_array_equal(hdf.read()[0], 2 * arr)
+
+    other = ste_io.HDFarray(filename)
+    datasets = other.expose()
+    hdf.annotate('annotated')
+    assert datasets[1][0, 1] == arr[0, 1]
+    assert ste_io.rarr_info(filename) == 'annotated'
+
+
+def test_new_file_is_created(tmp_path):
+    filename = str(tmp_path / 'new.hd5')
+    hdf = ste_io.HDFarray(filename)
+    assert hdf.read() is None
+    assert hdf.info is None
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+# seconds "import ste_io" may take on top of numpy (about 0.01 s when the
+# optional backends are imported lazily, 0.2 s and more otherwise)
+IMPORT_BUDGET = 0.1
+
+LAZY_MODULES = ('h5py', 'scipy', 'lxml', 'mako', 'pkg_resources', 'zstandard', 'lz4',
+                'multiprocessing')
+
+CODE = '''
+import sys, time
+import numpy
+t = time.perf_counter()
+import ste_io
+print(time.perf_counter() - t)
+print(' '.join(m for m in %r if m in sys.modules))
+''' % (LAZY_MODULES,)
+
+
+def _import_ste_io():
+    out = subprocess.run([sys.executable, '-W', 'ignore', '-c', CODE], cwd=SRC, check=True,
+                         capture_output=True, text=True).stdout.splitlines()
+    return float(out[0]), out[1].split() if len(out) > 1 else []
+
+
+def test_import_time():
+    runs = [_import_ste_io() for _ in range(3)]
+    assert runs[0][1] == [], 'imported eagerly: %s' % ', '.join(runs[0][1])
+    assert min(seconds for seconds, _ in runs) < IMPORT_BUDGET
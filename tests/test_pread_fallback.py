@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+
+import ste_io
+
+
+def test_without_pread(tmp_path, monkeypatch):
+    """Tile writer and RAT-Z reads emulate pread/pwrite where they are missing."""
+    monkeypatch.delattr(os, 'pread')
+    monkeypatch.delattr(os, 'pwrite')
+    arr = np.arange(40 * 30, dtype=np.float32).reshape(40, 30)
+
+    filename = str(tmp_path / 'tiles.rat')
+    with ste_io.RatTileWriter(filename, shape=arr.shape, dtype=arr.dtype,
+                              tile=(16, 16)) as writer:
+        while True:
+            claimed = writer.claim()
+            if claimed is None:
+                break
+            k, block = claimed
+            writer.write(arr[block[0]:block[1], block[2]:block[3]], k=k)
+        writer.write(arr[5:25, 3:7], block=[5, 25, 3, 7])
+    np.testing.assert_array_equal(ste_io.rrat(filename), arr)
+
+    filename = str(tmp_path / 'data.ratz')
+    ste_io.srat(filename, arr, compression='zlib')
+    np.testing.assert_array_equal(ste_io.rrat(filename), arr)
+    np.testing.assert_array_equal(ste_io.rrat(filename, block=[10, 20, 5, 25]), arr[10:20, 5:25])
@@ -0,0 +1,128 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+import ste_io
+
+etree = pytest.importorskip('lxml.etree')
+
+
+def _xml2val(typ, length, text):
+    param = etree.fromstring('<parameter><datatype length="%s">%s</datatype>'
+                             '<value>%s</value></parameter>' % (length, typ, text))
+    return ste_io.Py2Xml.xml2val(param.find('value'), param.find('datatype'))
+
+
+def test_numeric_arrays():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        np.testing.assert_array_equal(_xml2val('double', 3, '[0.5, 1e3, -2]'), [0.5, 1e3, -2])
+        np.testing.assert_array_equal(_xml2val('long', '3 2', '[1, 2, 3, 4, 5, 6]'),
+                                      np.arange(1, 7).reshape(2, 3))
+
+
+def test_malformed_array_uses_fallback():
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        with pytest.raises(ValueError):
+            _xml2val('double', 3, '[0.5, x, -2]')
+
+
+def _param(name, typ, length, text):
+    return ('<parameter name="%s"><remark>r</remark><datatype length="%s">%s</datatype>'
+            '<value>%s</value></parameter>' % (name, length, typ, text))
+
+
+def _object(name, v0=1.5, inner='inner'):
+    params = [_param('v0', 'double', 1, repr(v0)),
+              _param('n', 'long', 1, '42'),
+              _param('r', 'double', 4, '[0.0, 0.25, 0.5, 0.75]'),
+              _param('sub', 'struct', 1,
+                     '<object name="%s">%s</object>' % (inner, _param('a', 'long', 1, '7')))]
+    return '<object name="%s">%s</object>' % (name, ''.join(params))
+
+
+def _write_xml(filename, *objects):
+    with open(filename, 'w') as lun:
+        lun.write('<?xml version="1.0"?><stexml>%s</stexml>' % ''.join(objects))
+
+
+@pytest.fixture
+def xmlfile(tmp_path):
+    filename = str(tmp_path / 'pp.xml')
+    _write_xml(filename, _object('pp'), _object('other', v0=2.5))
+    return filename
+
+
+def test_cache_is_reused(xmlfile):
+    parsed = ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    assert os.path.exists(xmlfile + '.cache')
+    cached = ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    assert all('__root__' not in obj.__dict__ for obj in cached)
+    assert [obj.v0 for obj in cached] == [obj.v0 for obj in parsed] == [1.5, 2.5]
+    np.testing.assert_array_equal(cached[0].r, [0, 0.25, 0.5, 0.75])
+    assert cached[0].params() == ['v0', 'n', 'r', 'sub']
+
+
+def test_cache_ignored_after_changes(xmlfile):
+    ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    # same size, new modification time
+    _write_xml(xmlfile, _object('pp', v0=9.5), _object('other', v0=2.5))
+    st = os.stat(xmlfile)
+    os.utime(xmlfile, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert ste_io.Py2Xml.fromfile(xmlfile, cache=True)[0].v0 == 9.5
+    # new size
+    _write_xml(xmlfile, _object('pp', v0=12.25))
+    objects = ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    assert len(objects) == 1 and objects[0].v0 == 12.25
+
+
+def test_broken_cache_falls_back_to_parsing(xmlfile):
+    ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    with open(xmlfile + '.cache', 'wb') as lun:
+        lun.write(b'broken')
+    objects = ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    assert '__root__' in objects[0].__dict__ and objects[0].v0 == 1.5
+    assert ste_io.Py2Xml.fromfile(xmlfile, cache=True)[1].v0 == 2.5
+
+
+def test_cached_objects_load_the_tree_lazily(xmlfile, tmp_path):
+    ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    pp, other = ste_io.Py2Xml.fromfile(xmlfile, cache=True)
+    assert pp.sub.a == 7
+    assert '__root__' in pp.__dict__
+    other.v0 = 3.75
+    other.sub = pp.sub
+    assert other.v0 == 3.75 and other.sub.a == 7
+    filename = str(tmp_path / 'written.xml')
+    other.write(filename)
+    written = ste_io.Py2Xml.fromfile(filename)[0]
+    assert written.v0 == 3.75 and written.sub.a == 7 and written.n == 42
+
+
+def test_memo_invalidation(xmlfile):
+    pp = ste_io.Py2Xml.fromfile(xmlfile)[0]
+    r = pp.r
+    r[0] = 100
+    assert pp.r[0] == 0
+    pp.r = np.arange(3.)
+    np.testing.assert_array_equal(pp.r, [0, 1, 2])
+    assert pp.v0 == 1.5
+    pp.update({'v0': 4.5, 'n': 7, 'unknown': 1})
+    assert (pp.v0, pp.n) == (4.5, 7)
+    pp['v0'] = 5.5
+    assert pp['v0'] == 5.5 and 'v0' in pp and 'unknown' not in pp
+
+
+def test_iterfile_names(tmp_path):
+    filename = str(tmp_path / 'many.xml')
+    # the struct parameters contain nested objects named like the top-level ones
+    _write_xml(filename, _object('a', v0=1.0, inner='b'), _object('b', v0=2.0, inner='a'),
+               _object('c', v0=3.0, inner='b'), _object('b', v0=4.0))
+    assert [obj.v0 for obj in ste_io.Py2Xml.iterfile(filename)] == [1.0, 2.0, 3.0, 4.0]
+    objects = list(ste_io.Py2Xml.iterfile(filename, names='b'))
+    assert [obj.v0 for obj in objects] == [2.0, 4.0]
+    assert objects[0].sub.a == 7
+    assert [obj.v0 for obj in ste_io.Py2Xml.iterfile(filename, names=['a', 'c'])] == [1.0, 3.0]
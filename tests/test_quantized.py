@@ -0,0 +1,56 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import ste_io
+
+
+@pytest.fixture
+def quantized(tmp_path):
+    filename = str(tmp_path / 'data.rat')
+    arr = np.linspace(0., 1., 40, dtype=np.float32).reshape(8, 5)
+    ste_io.srat(filename, arr, quantize='float16')
+    return filename, arr
+
+
+def test_iter_blocks_dequantize(quantized):
+    filename, arr = quantized
+    tiles = [tile for block, tile in ste_io.irat(filename, rows=3)]
+    assert all(tile.dtype == np.float32 for tile in tiles)
+    np.testing.assert_allclose(np.concatenate(tiles), arr, rtol=1e-3)
+
+
+def test_logical_and_storage_dtype(quantized):
+    filename, arr = quantized
+    rat = ste_io.RatFile(filename)
+    assert rat.dtype == np.uint16
+    assert rat.data_dtype == np.float32
+    assert rat.read().dtype == rat.data_dtype
+    info = ste_io.scan_rat_dir(str(rat.filename).rsplit('/', 1)[0])[filename]
+    assert (info['dtype'], info['data_dtype']) == (rat.dtype, rat.data_dtype)
+
+
+def test_mread_warns(quantized):
+    filename, arr = quantized
+    with pytest.warns(UserWarning, match='quantized'):
+        assert ste_io.mrrat(filename).dtype == np.uint16
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        ste_io.srat(filename, arr)
+        ste_io.mrrat(filename)
+
+
+def test_reserved_words_without_magic(tmp_path):
+    """Small values in the reserved header words of other software don't mark quantization."""
+    filename = str(tmp_path / 'other.rat')
+    arr = np.arange(40, dtype=np.uint16).reshape(8, 5)
+    ste_io.srat(filename, arr)
+    rat = ste_io.RatFile(filename)
+    rat.Header.Rat.reserved[1:5] = [1, 4, 0, 0]
+    with open(filename, 'r+b') as lun:
+        lun.write(bytes(rat.Header))
+    rat = ste_io.RatFile(filename)
+    assert rat._quantization() is None
+    assert rat.data_dtype == np.uint16
+    np.testing.assert_array_equal(ste_io.rrat(filename), arr)
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import ste_io
+
+pytest.importorskip('h5py')
+
+
+def test_interrupted_conversion_releases_file(tmp_path, monkeypatch):
+    src, dst = str(tmp_path / 'data.rat'), str(tmp_path / 'data.hd5')
+    arr = np.arange(600, dtype=np.float32).reshape(30, 20)
+    ste_io.srat(src, arr)
+
+    read = ste_io.RatFile.read
+    def failing_read(self, block=None, **kwargs):
+        if block[0] >= 20:
+            raise RuntimeError('interrupted')
+        return read(self, block=block, **kwargs)
+    monkeypatch.setattr(ste_io.RatFile, 'read', failing_read)
+    # the traceback (kept by sys.last_traceback in interactive sessions) keeps the frame
+    # of rat2chunked alive
+    try:
+        ste_io.rat2chunked(src, dst, chunks=(10, 20), workers=1)
+    except RuntimeError:
+        traceback = sys.exc_info()[2]
+    else:
+        pytest.fail('the conversion was not interrupted')
+
+    code = 'import h5py; h5py.File(%r, "a").close()' % dst
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 0
+    monkeypatch.setattr(ste_io.RatFile, 'read', read)
+    ste_io.rat2chunked(src, dst, chunks=(10, 20), workers=1)
+    np.testing.assert_array_equal(ste_io.rarr(dst), arr)
+    del traceback
+
+
+def test_campaign_with_small_and_broken_files(tmp_path, capsys):
+    src, dst = tmp_path / 'campaign', tmp_path / 'out'
+    (src / 'sub').mkdir(parents=True)
+    small = np.arange(100, dtype=np.float32).reshape(10, 10)
+    big = np.arange(30 * 40, dtype=np.complex64).reshape(30, 40)
+    ste_io.srat(str(src / 'a_small.rat'), small)
+    broken = src / 'b_truncated.rat'
+    ste_io.srat(str(broken), big)
+    os.truncate(str(broken), os.path.getsize(str(broken)) // 2)
+    ste_io.srat(str(src / 'sub' / 'c_big.rat'), big)
+
+    failed = ste_io.rat2chunked_main(['-c', '8', '20', str(src), str(dst)])
+    assert failed == [str(broken)]
+    assert 'b_truncated.rat' in capsys.readouterr().out
+    np.testing.assert_array_equal(ste_io.rarr(str(dst / 'a_small.hd5')), small)
+    np.testing.assert_array_equal(ste_io.rarr(str(dst / 'sub' / 'c_big.hd5')), big)
+    with ste_io.HDFarray(str(dst / 'a_small.hd5')) as hdf:
+        assert hdf.file['D1'].chunks == (8, 10)
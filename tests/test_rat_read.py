@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+import ste_io
+
+
+@pytest.fixture
+def rat(tmp_path):
+    filename = str(tmp_path / 'data.rat')
+    arr = (np.arange(40)[:, None] * 100 + np.arange(30)).astype(np.float32)
+    arr = arr + 1j * arr
+    ste_io.srat(filename, arr.astype(np.complex64))
+    return ste_io.RatFile(filename), arr.astype(np.complex64)
+
+
+def test_read_into_out(rat):
+    rat, arr = rat
+    out = np.empty((10, 30), dtype=np.complex64)
+    assert rat.read(block=[5, 15, 0, 30], out=out) is out
+    np.testing.assert_array_equal(out, arr[5:15])
+    out = np.empty((10, 5), dtype=np.complex64)
+    np.testing.assert_array_equal(rat.read(block=[5, 15, 2, 7], out=out), arr[5:15, 2:7])
+    with pytest.raises(IOError):
+        rat.read(block=[5, 15, 0, 30], out=np.empty((10, 30), dtype=np.complex128))
+
+
+def test_parallel_read_and_stats(rat):
+    rat, arr = rat
+    stats = ste_io.ReadStats()
+    np.testing.assert_array_equal(rat.read(workers=4, stats=stats), arr)
+    np.testing.assert_array_equal(rat.read(block=[3, 37, 4, 20], workers=3, stats=stats),
+                                  arr[3:37, 4:20])
+    assert stats.nbytes == arr.nbytes + arr[3:37, 4:20].nbytes
+    assert stats.seconds > 0 and stats.gbps > 0
+
+
+def test_decimate(rat):
+    rat, arr = rat
+    np.testing.assert_array_equal(rat.read(decimate=[3, 4]), arr[::3, ::4])
+    np.testing.assert_array_equal(rat.read(block=[1, 38, 2, 29], decimate=[5, 2]),
+                                  arr[1:38:5, 2:29:2])
+    np.testing.assert_array_equal(rat.mread(decimate=[2, 7]), arr[::2, ::7])
+
+
+@pytest.mark.parametrize('mode', ['mean', 'intensity', 'complex'])
+def test_read_multilooked(rat, mode):
+    rat, arr = rat
+    ml = rat.read_multilooked(looks=(3, 4), mode=mode)
+    blocks = arr[:39, :28].reshape(13, 3, 7, 4)
+    if mode == 'mean':
+        expected = np.abs(blocks).mean(axis=(1, 3))
+    elif mode == 'intensity':
+        expected = (np.abs(blocks) ** 2).mean(axis=(1, 3))
+    else:
+        expected = blocks.mean(axis=(1, 3))
+    assert ml.shape == (13, 7)
+    np.testing.assert_allclose(ml, expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_tiles_with_overlap(rat, prefetch):
+    rat, arr = rat
+    if prefetch:
+        stats = ste_io.ReadStats()
+        tiles = list(rat.prefetching_blocks(rows=16, overlap=3, workers=2, stats=stats))
+        assert stats.nbytes == sum(tile.nbytes for block, tile in tiles)
+    else:
+        tiles = list(rat.iter_blocks(rows=16, overlap=3))
+    assert [block[:2] for block, tile in tiles] == [[0, 19], [13, 35], [29, 40]]
+    for block, tile in tiles:
+        assert block[2:] == [0, 30]
+        np.testing.assert_array_equal(tile, arr[block[0]:block[1]])
+
+
+def _write(filename, arr, info):
+    header = ste_io.RatHeader(shape=arr.shape, dtype=arr.dtype)
+    header.Info.info = info.encode()
+    ste_io.srat(filename, arr, header=header)
+
+
+def test_header_cache_invalidated_on_rewrite(tmp_path):
+    filename = str(tmp_path / 'data.rat')
+    _write(filename, np.zeros((4, 5), dtype=np.float32), 'first')
+    assert ste_io.RatFile(filename).info == 'first'
+    _write(filename, np.ones((6, 3), dtype=np.int16), 'second')
+    rat = ste_io.RatFile(filename)
+    assert (rat.info, tuple(rat.shape), rat.dtype) == ('second', (6, 3), np.int16)
+
+    # a header rewritten in place by someone else (same size, new mtime)
+    rat.Header.Info.info = b'third'
+    with open(filename, 'r+b') as lun:
+        lun.write(bytes(rat.Header))
+    st = os.stat(filename)
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert ste_io.RatFile(filename).info == 'third'
+    np.testing.assert_array_equal(ste_io.rrat(filename), np.ones((6, 3)))
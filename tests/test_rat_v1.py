@@ -0,0 +1,61 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import ste_io
+
+
+def _write_v1(filename, arr, info, xdr):
+    """Write a RAT v1.0 file (XDR files are big-endian with one more reserved word)."""
+    endian = '>' if xdr else '<'
+    header = [arr.ndim] + list(arr.shape[::-1]) + [ste_io.get_var(arr.dtype).value, 0]
+    header += [0] * (3 + xdr)
+    with open(filename, 'wb') as lun:
+        lun.write(np.array(header, dtype=endian + 'i4').tobytes())
+        lun.write(info.encode().ljust(80, b' '))
+        lun.write(arr.astype(arr.dtype.newbyteorder(endian)).tobytes())
+    return 104 + 4 * arr.ndim + 4 * xdr
+
+
+@pytest.fixture(params=[(0, 'complex64'), (1, 'complex64'), (1, 'float32'), (0, 'int16')],
+                ids=['le-c8', 'xdr-c8', 'xdr-f4', 'le-i2'])
+def v1_file(tmp_path, request):
+    xdr, dtype = request.param
+    filename = str(tmp_path / 'v1.rat')
+    arr = (np.arange(12 * 10) * (1 + 2j if dtype == 'complex64' else 1)).astype(dtype)
+    arr = arr.reshape(12, 10)
+    offset = _write_v1(filename, arr, 'old v1 file', xdr)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        rat = ste_io.RatFile(filename)
+    return rat, arr, xdr, offset
+
+
+def test_header(v1_file):
+    rat, arr, xdr, offset = v1_file
+    assert rat.version == 1.0 and rat.xdrflag == xdr
+    assert tuple(rat.shape) == arr.shape and rat.dtype == arr.dtype
+    assert rat.info == 'old v1 file'
+    assert rat._data_offset() == offset
+
+
+def test_read(v1_file):
+    rat, arr, xdr, offset = v1_file
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        np.testing.assert_array_equal(rat.read(), arr)
+        np.testing.assert_array_equal(rat.read(block=[2, 9, 0, 10]), arr[2:9])
+        np.testing.assert_array_equal(rat.read(block=[1, 11, 3, 8]), arr[1:11, 3:8])
+        np.testing.assert_array_equal(rat.read(block=[1, 11, 0, 10], decimate=[3, 2]),
+                                      arr[1:11:3, ::2])
+        assert rat.read().dtype == arr.dtype
+
+
+def test_mread(v1_file):
+    rat, arr, xdr, offset = v1_file
+    view = rat.mread(block=[1, 11, 3, 8])
+    assert view.dtype == arr.dtype.newbyteorder('>' if xdr else '<')
+    if xdr and arr.dtype == np.complex64:
+        assert view.dtype.str == '>c8'
+    np.testing.assert_array_equal(view, arr[1:11, 3:8])
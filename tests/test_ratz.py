@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import ste_io
+
+CODECS = ['zlib'] + [name for name, module in [('zstd', 'zstandard'), ('lz4', 'lz4_frame')]
+                     if ste_io._optional_import(module) is not None]
+
+
+def _data(shape=(50, 30)):
+    rows = np.arange(shape[0])[:, None]
+    return (rows + 1j * np.arange(shape[1])).astype(np.complex64)
+
+
+@pytest.fixture
+def ratz(tmp_path):
+    """A RAT-Z file whose chunks (7 lines) don't divide the shape."""
+    filename = str(tmp_path / 'data.rat')
+    arr = _data()
+    ste_io.RatZFile(filename).write(arr, compression='zlib', chunk_rows=7)
+    return filename, arr
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('shuffle', [True, False])
+def test_codecs(tmp_path, codec, shuffle):
+    filename = str(tmp_path / 'data.rat')
+    arr = _data()
+    ste_io.RatZFile(filename).write(arr, compression=codec, chunk_rows=7, shuffle=shuffle)
+    rat = ste_io.open_rat(filename)
+    assert isinstance(rat, ste_io.RatZFile)
+    assert rat.Zheader.nchunks == 8
+    np.testing.assert_array_equal(rat.read(), arr)
+
+
+def test_blocks(ratz):
+    filename, arr = ratz
+    rat = ste_io.open_rat(filename)
+    np.testing.assert_array_equal(rat.read(block=[5, 23, 4, 9]), arr[5:23, 4:9])
+    np.testing.assert_array_equal(rat.read(block=[49, 50, 0, 30]), arr[49:])
+    np.testing.assert_array_equal(rat.read(block=[3, 48, 1, 30], decimate=[4, 3]),
+                                  arr[3:48:4, 1::3])
+    np.testing.assert_array_equal(rat.read(workers=3), arr)
+    np.testing.assert_array_equal(rat.read(block=[5, 41, 0, 30], workers=4), arr[5:41])
+
+
+def test_block_write_across_chunks(ratz):
+    filename, arr = ratz
+    patch = -np.ones((12, 6), dtype=np.complex64)
+    ste_io.srat(filename, patch, block=[5, 17, 10, 16])
+    ste_io.srat(filename, patch[:3], block=[47, 50, 0, 6])
+    arr[5:17, 10:16] = patch
+    arr[47:, :6] = patch[:3]
+    np.testing.assert_array_equal(ste_io.RatZFile(filename).read(), arr)
+    np.testing.assert_array_equal(ste_io.rrat(filename, block=[0, 20, 8, 20]), arr[:20, 8:20])
+
+
+def test_create_and_partial_writes(tmp_path):
+    filename = str(tmp_path / 'created.rat')
+    ste_io.RatZFile(filename).create(shape=(20, 8), dtype='float32', compression='zlib',
+                                     chunk_rows=6)
+    part = np.arange(40, dtype=np.float32).reshape(5, 8)
+    ste_io.srat(filename, part, block=[4, 9, 0, 8])
+    expected = np.zeros((20, 8), dtype=np.float32)
+    expected[4:9] = part
+    np.testing.assert_array_equal(ste_io.rrat(filename), expected)
+
+
+def test_tiles_and_multilook(ratz):
+    filename, arr = ratz
+    tiles = list(ste_io.irat(filename, rows=8, overlap=2))
+    assert tiles[0][0] == [0, 10, 0, 30] and tiles[1][0] == [6, 18, 0, 30]
+    for block, tile in tiles:
+        np.testing.assert_array_equal(tile, arr[block[0]:block[1]])
+    ml = ste_io.open_rat(filename).read_multilooked(looks=(4, 3), mode='complex')
+    expected = arr[:48].reshape(12, 4, 10, 3).mean(axis=(1, 3))
+    np.testing.assert_allclose(ml, expected, rtol=1e-6)
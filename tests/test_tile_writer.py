@@ -0,0 +1,64 @@
+import os
+import multiprocessing
+
+import numpy as np
+import pytest
+
+import ste_io
+
+fcntl = pytest.importorskip('fcntl')
+
+
+def _write_block(filename, started, release, by_tile):
+    """Write a block (or tile), keeping the lock after the data is written until released."""
+    pwrite_block = ste_io.RatFile._pwrite_block
+
+    def slow_pwrite_block(self, fd, arr, block):
+        pwrite_block(self, fd, arr, block)
+        started.set()
+        release.wait(10)
+
+    ste_io.RatFile._pwrite_block = slow_pwrite_block
+    with ste_io.RatTileWriter(filename) as writer:
+        if by_tile:
+            writer.write(np.ones((10, 20), dtype=np.float32), k=1)
+        else:
+            writer.write(np.ones((10, 20), dtype=np.float32), block=[10, 20, 0, 20])
+
+
+def _try_lock(fd, start, length):
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, length, start, os.SEEK_SET)
+    except OSError:
+        return False
+    fcntl.lockf(fd, fcntl.LOCK_UN, length, start, os.SEEK_SET)
+    return True
+
+
+@pytest.mark.parametrize('by_tile', [False, True])
+def test_block_stays_locked_during_write(tmp_path, by_tile):
+    filename = str(tmp_path / 'tiles.rat')
+    writer = ste_io.RatTileWriter(filename, shape=(40, 20), dtype='float32', tile=(10,))
+    row_bytes = 20 * 4
+    start = writer.rat._data_offset() + 10 * row_bytes
+
+    context = multiprocessing.get_context('fork')
+    started, release = context.Event(), context.Event()
+    proc = context.Process(target=_write_block, args=(filename, started, release, by_tile))
+    proc.start()
+    fd = os.open(filename, os.O_RDWR)
+    try:
+        assert started.wait(10)
+        assert not _try_lock(fd, start, 10 * row_bytes)
+        assert _try_lock(fd, start + 10 * row_bytes, row_bytes)
+        release.set()
+        proc.join(10)
+        assert proc.exitcode == 0
+        assert _try_lock(fd, start, 10 * row_bytes)
+    finally:
+        release.set()
+        os.close(fd)
+
+    data = ste_io.RatFile(filename).read()
+    assert np.all(data[10:20] == 1) and np.all(data[:10] == 0)
+    writer.close(verify=False)